@@ -0,0 +1,271 @@
+import random
+import time
+import numpy as np
+from network import PopulationNetwork
+from profiling import add_timings
+from game import take_cell, start_snake
+import sensors
+
+
+class BatchSnake:
+    """Class which contains the game logic for a whole batch of Snake games that are stepped together using NumPy
+        arrays. Every game follows the same rules (and food placement) as Snake, so a game started with a given seed
+        finishes with the same score as run_game with that seed."""
+
+    # Row/column offset of each move, in the same order as the outputs of the neural network
+    moves = np.array([[-1, 0], [+1, 0], [0, -1], [0, +1]])
+    straight_offsets = np.array([sensors.direction_offsets[direction] for direction in sensors.straight_directions])
+    diagonal_offsets = np.array([sensors.direction_offsets[direction] for direction in sensors.diagonal_directions])
+
+    def __init__(self, _XSIZE, _YSIZE):
+        """Stores the board size used by every game in the batch"""
+        self.XSIZE = _XSIZE
+        self.YSIZE = _YSIZE
+
+    def reset(self, seeds, detect_cycles=False, starve_steps=None):
+        """Starts one new game for each seed provided. Setting detect_cycles ends a game as soon as the snake
+            repeats a (head, direction, length, food) state, as it is then treated as looping until it starves.
+            starve_steps sets how many steps a snake can go without food (XSIZE*YSIZE*1.5 if None)."""
+        num_games = len(seeds)
+        self.starve_steps = self.XSIZE * self.YSIZE * 1.5 if starve_steps is None else starve_steps
+        self.rngs = [random.Random(int(seed)) for seed in seeds]
+
+        # The board holds the tick at which the head last entered each cell, so a cell is part of a snake if it was
+        # entered within the last length ticks. This means the tail never has to be removed explicitly.
+        self.tick = 0
+        start = np.array(start_snake(self.XSIZE, self.YSIZE))   # Initial snake co-ordinates, head first
+        start_cells = start[:, 0] * self.XSIZE + start[:, 1]
+        self.board = np.full((num_games, self.YSIZE, self.XSIZE), np.iinfo(np.int32).min // 2, dtype=np.int32)
+        self.board[:, start[:, 0], start[:, 1]] = -np.arange(len(start))
+        # The cell entered at each tick (modulo the board area, which is more than the longest snake) so the tail
+        # cell can be found when it moves
+        self.trail = np.zeros((num_games, self.XSIZE * self.YSIZE + 1), dtype=np.int32)
+        self.trail[:, -np.arange(len(start)) % self.trail.shape[1]] = start_cells
+        self.head = np.tile(start[0], (num_games, 1))
+        self.length = np.full(num_games, len(start))
+        self.direction = np.full(num_games, 3)  # right
+        self.time_until_starve = np.full(num_games, self.starve_steps)
+        self.score = np.zeros(num_games, dtype=int)
+        self.steps = np.zeros(num_games, dtype=int)
+        self.alive = np.ones(num_games, dtype=bool)
+
+        # (head, direction) states visited since the food was last eaten (so length & food are the same) and the
+        # steps left until starving of the games ended by a cycle, which are the steps saved by ending them early
+        self.visited = np.zeros((num_games, self.YSIZE, self.XSIZE, 4), dtype=bool) if detect_cycles else None
+        self.skipped = np.zeros(num_games, dtype=int)
+        self.starved = np.zeros(num_games, dtype=bool)
+
+        # The cells inside the walls not taken up by the snake & the index of each cell in that list (-1 if taken
+        # or a wall), updated the same way as Snake so the same food cells are chosen
+        self.food_positions = np.full(self.XSIZE * self.YSIZE, -1)
+        food_cells = [y * self.XSIZE + x for y in range(1, self.YSIZE-1) for x in range(1, self.XSIZE-1)]
+        self.food_positions[food_cells] = np.arange(len(food_cells))
+        free_cells, free_positions = food_cells[:], self.food_positions.tolist()
+        for cell in start_cells.tolist():
+            if free_positions[cell] >= 0:
+                take_cell(free_cells, free_positions, cell)
+        self.free_cells = np.zeros((num_games, len(food_cells)), dtype=np.int32)
+        self.free_cells[:, :len(free_cells)] = free_cells
+        self.free_positions = np.tile(np.array(free_positions, dtype=np.int32), (num_games, 1))
+        self.free_count = np.full(num_games, len(free_cells))
+
+        # Food is placed twice at the start to consume the same random numbers as Snake.reset followed by run_game
+        self.food = np.zeros((num_games, 2), dtype=int)
+        for game in range(num_games):
+            self.place_food(game)
+            self.place_food(game)
+
+    def occupied(self, games, ys, xs):
+        """Returns True for each coordinate that is part of the snake of the matching game"""
+        return self.board[games, ys, xs] > (self.tick - self.length[games])
+
+    def place_food(self, game):
+        """Randomly places the food of a single game in one of the cells (inside the walls) not taken up by the
+            snake, choosing the same cell as Snake.place_food"""
+        self.food[game] = divmod(self.free_cells[game, self.rngs[game].randrange(self.free_count[game])], self.XSIZE)
+
+    def take_cells(self, games, cells):
+        """Removes a cell from the free cells of each game by moving its last free cell into its place"""
+        positions = self.free_positions[games, cells]
+        last = self.free_cells[games, self.free_count[games] - 1]
+        self.free_cells[games, positions] = last
+        self.free_positions[games, last] = positions
+        self.free_positions[games, cells] = -1
+        self.free_count[games] -= 1
+
+    def release_cells(self, games, cells):
+        """Adds a cell to the end of the free cells of each game"""
+        self.free_cells[games, self.free_count[games]] = cells
+        self.free_positions[games, cells] = self.free_count[games]
+        self.free_count[games] += 1
+
+    def step(self, actions):
+        """Moves the snake of every game still running using the provided actions (indexes into moves) and ends the
+            games where the snake ate itself, hit a wall or starved"""
+        games = np.flatnonzero(self.alive)
+        head = self.head[games] + self.moves[actions]
+        cells = head[:, 0] * self.XSIZE + head[:, 1]
+        entered_empty = ~self.occupied(games, head[:, 0], head[:, 1])
+        self.tick += 1
+        tail_cells = self.trail[games, (self.tick - self.length[games]) % self.trail.shape[1]]
+
+        ate = (head == self.food[games]).all(axis=1)
+        self.length[games] += ate
+        hit_self = self.occupied(games, head[:, 0], head[:, 1])
+        hit_wall = (head[:, 0] == 0) | (head[:, 0] == (self.YSIZE-1)) | (head[:, 1] == 0) | \
+            (head[:, 1] == (self.XSIZE-1))
+
+        self.board[games, head[:, 0], head[:, 1]] = self.tick
+        self.trail[games, self.tick % self.trail.shape[1]] = cells
+        take = entered_empty & (self.food_positions[cells] >= 0)
+        self.take_cells(games[take], cells[take])
+        release = ~ate & (tail_cells != cells) & (self.food_positions[tail_cells] >= 0)
+        self.release_cells(games[release], tail_cells[release])
+        self.head[games] = head
+        self.direction[games] = actions
+        self.time_until_starve[games] = np.where(ate, self.starve_steps, self.time_until_starve[games] - 1)
+
+        for game in games[ate]:
+            self.place_food(game)
+        self.score[games] += ate
+        self.steps[games] += 1
+
+        starved = ~(hit_self | hit_wall) & (self.time_until_starve[games] == 0)
+        self.starved[games[starved]] = True
+        game_over = hit_self | hit_wall | starved
+        if self.visited is not None:
+            self.visited[games[ate]] = False
+            running = games[~game_over]
+            state = (running, head[~game_over, 0], head[~game_over, 1], actions[~game_over])
+            cycle = self.visited[state]
+            self.visited[state] = True
+            self.skipped[running[cycle]] = self.time_until_starve[running[cycle]]
+            game_over[~game_over] = cycle
+        self.alive[games[game_over]] = False
+
+    # Sensor Functions - each returns one column per direction for every game still running
+    def obstacle_check(self, games, offsets):
+        """Returns 0 where a tail or wall is found in the adjacent cell of a given direction, otherwise 1"""
+        ys = self.head[games, 0, None] + offsets[:, 0]
+        xs = self.head[games, 1, None] + offsets[:, 1]
+        wall = (ys == 0) | (ys == (self.YSIZE-1)) | (xs == 0) | (xs == (self.XSIZE-1))
+        return (~(wall | self.occupied(games[:, None], ys, xs))).astype(float)
+
+    def sense_food(self, games, offsets):
+        """Returns 1 where the food is in the adjacent cell of a given direction, otherwise 0"""
+        food_offset = self.food[games] - self.head[games]
+        return (food_offset[:, None, :] == offsets).all(axis=2).astype(float)
+
+    def food_direction(self, games):
+        """Returns the sign of the food position relative to the snakes head in the x & y axis"""
+        return np.sign(self.food[games] - self.head[games])[:, ::-1].astype(float)
+
+    def steps_to_wall(self, games, offsets):
+        """Returns the number of steps from the head until a wall cell is reached in a given direction"""
+        head = self.head[games]
+        limits = []
+        for axis, size in enumerate((self.YSIZE, self.XSIZE)):
+            towards_end = np.where(offsets[:, axis] > 0, size - 1 - head[:, axis, None], head[:, axis, None])
+            limits.append(np.where(offsets[:, axis] == 0, np.iinfo(np.int64).max, towards_end))
+        return np.minimum(*limits)
+
+    def distance_to_wall(self, games, offsets):
+        """Returns the distance to the wall in a given direction"""
+        return (self.steps_to_wall(games, offsets) - 1).astype(float)
+
+    def distance_to_tail(self, games, offsets):
+        """Returns the shortest distance in a given direction to the snakes tail, infinity if tail not in the
+            direction"""
+        reach = self.steps_to_wall(games, offsets)
+        steps = np.arange(1, max(self.XSIZE, self.YSIZE))
+        ys = self.head[games, 0, None, None] + offsets[None, :, 0, None] * steps
+        xs = self.head[games, 1, None, None] + offsets[None, :, 1, None] * steps
+        in_reach = steps <= reach[:, :, None]
+        ys, xs = np.clip(ys, 0, self.YSIZE-1), np.clip(xs, 0, self.XSIZE-1)
+        tail = self.occupied(games[:, None, None], ys, xs) & in_reach
+        return np.where(tail.any(axis=2), tail.argmax(axis=2), np.inf)
+
+    def distance_to_food(self, games, offsets):
+        """Returns the shortest distance in a given direction to the food, infinity if food not in the direction"""
+        food_offset = (self.food[games] - self.head[games])[:, None, :]
+        steps = np.abs(food_offset).max(axis=2)
+        in_line = (food_offset == offsets * steps[:, :, None]).all(axis=2) & (steps > 0)
+        return np.where(in_line, steps - 1, np.inf)
+
+    # Sensor groups - the batched equivalent of each group in sensors.sensor_groups
+    def local_straight(self, games):
+        return np.hstack((self.obstacle_check(games, self.straight_offsets),
+                          self.sense_food(games, self.straight_offsets)))
+
+    def local_diagonal(self, games):
+        return np.hstack((self.obstacle_check(games, self.diagonal_offsets),
+                          self.sense_food(games, self.diagonal_offsets)))
+
+    def global_straight(self, games):
+        return np.hstack((self.distance_to_wall(games, self.straight_offsets),
+                          self.distance_to_tail(games, self.straight_offsets),
+                          self.distance_to_food(games, self.straight_offsets)))
+
+    def global_diagonal(self, games):
+        return np.hstack((self.distance_to_wall(games, self.diagonal_offsets),
+                          self.distance_to_tail(games, self.diagonal_offsets),
+                          self.distance_to_food(games, self.diagonal_offsets)))
+
+    sensor_groups = {"local_straight": local_straight, "local_diagonal": local_diagonal,
+                     "global_straight": global_straight, "global_diagonal": global_diagonal,
+                     "food_direction": food_direction}
+
+    def sense(self, algorithm):
+        """Returns the neural network inputs for the given algorithm variant, one row for each game still running.
+            Only the sensor groups used by the variant are calculated."""
+        games = np.flatnonzero(self.alive)
+        return np.hstack([self.sensor_groups[group](self, games) for group in sensors.feature_specs[algorithm]])
+
+
+def run_games(network, genomes, snake_game, algorithm, seeds, detect_cycles=False, starve_steps=None, timings=None,
+              action_tables=False):
+    '''Plays one game for each genome all at once using the batched game logic. Returns the final scores, the
+        number of steps each game lasted, the number of steps skipped by ending looping games early (with
+        detect_cycles) and whether each game ended by the snake starving. Each game uses its own seed for food
+        placement so its score matches run_game with the same weights, seed and options. If a timings dictionary is
+        provided the seconds spent sensing, in the network and updating the games are added to it.
+
+        Setting action_tables first builds the table of the decision of every distinct genome for every possible
+        input in one batched pass (see sensors.check_action_tables for the variants allowed), so each step just
+        looks the decisions up, which gives the same games. Building a table costs about as much as 100 ("a") to
+        450 ("b") batched steps of its network, so this is only faster when the networks play longer games than
+        that. Random networks play a handful of steps, which makes it several times slower.'''
+    population = PopulationNetwork(network, genomes)
+    decide = population.decide
+    if action_tables:
+        sensors.check_action_tables(algorithm)
+        start = time.perf_counter() if timings is not None else None
+        # An individual playing several games appears once per game, its table is only built once
+        distinct, table_rows = np.unique(np.asarray(genomes, dtype=float), axis=0, return_inverse=True)
+        tables = PopulationNetwork(network, distinct).tabulate(sensors.input_states(algorithm))
+        table_rows = table_rows.ravel()
+        strides, base = sensors.state_strides(algorithm)
+        strides = np.array(strides, dtype=float)
+
+        def decide(inputs, rows):
+            return tables[table_rows[rows], (inputs @ strides).astype(int) - base]
+        if timings is not None:
+            add_timings(timings, "tables", start)
+
+    games = BatchSnake(snake_game.XSIZE, snake_game.YSIZE)
+    games.reset(seeds, detect_cycles, starve_steps)
+    if timings is None:
+        while games.alive.any():
+            inputs = games.sense(algorithm)
+            games.step(decide(inputs, np.flatnonzero(games.alive)))
+    else:
+        start = time.perf_counter()
+        while games.alive.any():
+            inputs = games.sense(algorithm)
+            start = add_timings(timings, "sense", start)
+            actions = decide(inputs, np.flatnonzero(games.alive))
+            start = add_timings(timings, "network", start)
+            games.step(actions)
+            start = add_timings(timings, "update", start)
+
+    return games.score, games.steps, games.skipped, games.starved
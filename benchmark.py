@@ -0,0 +1,268 @@
+'''Benchmark suite for the game engine, neural network and genetic algorithm. Every benchmark uses fixed seeds so
+    results are comparable between runs. Run with:
+
+        python benchmark.py --output results.json
+        python benchmark.py --output new.json --baseline results.json
+
+    The second form compares the results against a stored baseline and exits with status 1 if any benchmark is
+    slower (or uses more memory) than the baseline by more than the tolerance.'''
+from enums import Experiment, ExperimentType
+from game import Snake, run_game
+from bitboard import BitboardSnake
+from network import generate_neural_net, PopulationNetwork
+from batch_game import run_games
+from genetic import genetic_algorithm
+import sensors
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import numpy as np
+from deap import base
+from deap import creator
+
+XSIZE = YSIZE = 16
+
+
+def best_time(function, repeats=5):
+    '''Returns the shortest time taken by the function over a number of repeats'''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def result(value, unit, higher_is_better):
+    '''Returns a benchmark result in the format written to the results file'''
+    return {"value": float(value), "unit": unit, "higher_is_better": higher_is_better}
+
+
+def benchmark_genomes(algorithm, num_genomes):
+    '''Returns a fixed set of random genomes for the algorithm variant'''
+    ind_size, network = generate_neural_net(algorithm)
+    return network, np.random.default_rng(0).uniform(-1.0, 1.0, (num_genomes, ind_size))
+
+
+def bench_games(num_games):
+    '''Game ticks per second of run_game (one game at a time, with Snake & BitboardSnake) and run_games (one batch)
+        for every algorithm variant, and with action tables (including building them) for the variants they are
+        allowed for. These are random networks playing short games, where building the tables costs more than
+        they save.'''
+    results = {}
+    for algorithm in sensors.feature_specs:
+        network, genomes = benchmark_genomes(algorithm, num_games)
+        snake_game, seeds = Snake(XSIZE, YSIZE), list(range(num_games))
+
+        steps = run_games(network, genomes, snake_game, algorithm, seeds)[1].sum()
+
+        def single(game):
+            for genome, seed in zip(genomes, seeds):
+                network.bindWeights(genome)
+                run_game(game, network, algorithm, seed)
+        results[f"run_game_ticks_per_sec_{algorithm}"] = result(steps / best_time(lambda: single(snake_game)),
+                                                                "ticks/s", True)
+        bitboard_game = BitboardSnake(XSIZE, YSIZE)
+        results[f"run_game_bitboard_ticks_per_sec_{algorithm}"] = result(
+            steps / best_time(lambda: single(bitboard_game)), "ticks/s", True)
+        results[f"run_games_ticks_per_sec_{algorithm}"] = result(
+            steps / best_time(lambda: run_games(network, genomes, snake_game, algorithm, seeds)), "ticks/s", True)
+        if sensors.num_states(algorithm) is not None and sensors.num_states(algorithm) <= sensors.max_table_states:
+            results[f"run_games_tables_ticks_per_sec_{algorithm}"] = result(
+                steps / best_time(lambda: run_games(network, genomes, snake_game, algorithm, seeds,
+                                                    action_tables=True)), "ticks/s", True)
+    return results
+
+
+def bench_board_sizes(num_games, sizes=(16, 32, 64, 128), starve_steps=200):
+    '''Game ticks per second of run_game (with Snake & BitboardSnake) and run_games for each board size, using the
+        variant with every sensor group. The starvation window is fixed so every size plays games of a similar
+        length, which leaves the cost per tick, and that should stay close to flat as the board grows.'''
+    results = {}
+    network, genomes = benchmark_genomes("h", num_games)
+    seeds = list(range(num_games))
+    for size in sizes:
+        snake_game, bitboard_game = Snake(size, size), BitboardSnake(size, size)
+        steps = run_games(network, genomes, snake_game, "h", seeds, starve_steps=starve_steps)[1].sum()
+
+        def single(game):
+            for genome, seed in zip(genomes, seeds):
+                network.bindWeights(genome)
+                run_game(game, network, "h", seed, starve_steps=starve_steps)
+        results[f"run_game_ticks_per_sec_size_{size}"] = result(steps / best_time(lambda: single(snake_game)),
+                                                                "ticks/s", True)
+        results[f"run_game_bitboard_ticks_per_sec_size_{size}"] = result(
+            steps / best_time(lambda: single(bitboard_game)), "ticks/s", True)
+        results[f"run_games_ticks_per_sec_size_{size}"] = result(
+            steps / best_time(lambda: run_games(network, genomes, snake_game, "h", seeds, starve_steps=starve_steps)),
+            "ticks/s", True)
+    return results
+
+
+def bench_feed_forward(num_calls):
+    '''Network evaluations per second of feedForward one input at a time and of a batch of networks at once'''
+    network, genomes = benchmark_genomes("h", num_calls)
+    inputs = np.random.default_rng(0).uniform(-1.0, 14.0, (num_calls, sensors.input_size("h")))
+    network.setWeightsLinear(genomes[0])
+    population = PopulationNetwork(network, genomes)
+
+    def single():
+        for row in inputs:
+            network.feedForward(row)
+    return {"feed_forward_per_sec_single": result(num_calls / best_time(single), "calls/s", True),
+            "feed_forward_per_sec_batched": result(num_calls / best_time(lambda: population.activate(inputs)),
+                                                   "calls/s", True)}
+
+
+def snake_of_length(length):
+    '''Returns a game whose snake has the given length, winding along the rows inside the walls'''
+    snake_game = Snake(XSIZE, YSIZE)
+    for segment in snake_game.snake:
+        snake_game.remove_segment(segment)
+    cells = []
+    for y in range(1, YSIZE - 1):
+        row = [[y, x] for x in range(1, XSIZE - 1)]
+        cells += row if y % 2 else row[::-1]
+    snake_game.snake.clear()
+    for cell in cells[:length]:
+        snake_game.snake.appendleft(cell)
+        snake_game.add_segment(cell)
+    return snake_game
+
+
+def bench_place_food(num_calls):
+    '''Time per call of place_food as the snake grows to fill the board'''
+    results = {}
+    for length in (11, 50, 100, 150, (XSIZE - 2) * (YSIZE - 2) - 1):
+        snake_game = snake_of_length(length)
+        snake_game.rng = random.Random(0)
+
+        def place():
+            for _ in range(num_calls):
+                snake_game.place_food()
+        results[f"place_food_us_length_{length}"] = result(best_time(place) / num_calls * 1e6, "us", False)
+    return results
+
+
+def bench_generations(pop_nums, workers, gen_num):
+    '''Mean wall time of a generation of the genetic algorithm for each population size (serial) and for each
+        number of workers (at the middle population size)'''
+    results = {}
+    ind_size, network = generate_neural_net("b")
+    configs = [(pop_num, 1) for pop_num in pop_nums] + \
+        [(pop_nums[len(pop_nums) // 2], num_workers) for num_workers in workers if num_workers > 1]
+    for pop_num, num_workers in configs:
+        logbook, _ = genetic_algorithm(ind_size, network, Snake(XSIZE, YSIZE), None, True, gen_num, pop_num, seed=0,
+                                       workers=num_workers, profile=True)
+        results[f"generation_sec_pop_{pop_num}_workers_{num_workers}"] = result(
+            np.mean(logbook.select("time_generation")), "s", False)
+    return results
+
+
+def bench_memory(pop_num):
+    '''Peak memory of holding a population as DEAP individuals & as a genome matrix, and the size on disk of a
+        saved run'''
+    ind_size, network = generate_neural_net("b")
+    creator.create("FitnessMax", base.Fitness, weights=(1.0,))
+    creator.create("Individual", list, fitness=creator.FitnessMax)
+    genomes = np.random.default_rng(0).uniform(-1.0, 1.0, (pop_num, ind_size))
+
+    def peak_memory(function):
+        tracemalloc.start()
+        kept = function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del kept
+        return peak
+
+    results = {
+        "population_peak_bytes_individuals": result(
+            peak_memory(lambda: [creator.Individual(genome) for genome in genomes.tolist()]), "bytes", False),
+        "population_peak_bytes_matrix": result(peak_memory(lambda: genomes.copy()), "bytes", False),
+    }
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            genetic_algorithm(ind_size, network, Snake(XSIZE, YSIZE), None, True, 5, pop_num, seed=0,
+                              exp=Experiment.FINAL_ALGORITHM, exp_type=ExperimentType.FINAL_ALGORITHM)
+            size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder)
+                       for name in names)
+        finally:
+            os.chdir(cwd)
+    results["saved_run_bytes"] = result(size, "bytes", False)
+    return results
+
+
+def run_benchmarks(quick=False, workers=(1, 2, 4)):
+    '''Runs every benchmark and returns the results along with a description of the machine they ran on'''
+    scale = 0.2 if quick else 1.0
+    results = {}
+    for name, benchmark in (("games", lambda: bench_games(int(200 * scale))),
+                            ("board_sizes", lambda: bench_board_sizes(int(50 * scale))),
+                            ("feed_forward", lambda: bench_feed_forward(int(20000 * scale))),
+                            ("place_food", lambda: bench_place_food(int(2000 * scale))),
+                            ("generations", lambda: bench_generations((200, 1500) if quick else (200, 1500, 5000),
+                                                                      workers, 2 if quick else 5)),
+                            ("memory", lambda: bench_memory(1500))):
+        logging.info(f"Running {name} benchmarks")
+        results.update(benchmark())
+
+    machine = {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+               "processor": platform.processor(), "cpu_count": os.cpu_count(), "quick": quick,
+               "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    return {"machine": machine, "results": results}
+
+
+def compare(results, baseline, tolerance=0.1):
+    '''Returns the relative change of every benchmark found in both results (positive is better) and the names of
+        the benchmarks that are worse than the baseline by more than the tolerance'''
+    changes, regressions = {}, []
+    for name, new in results["results"].items():
+        if name not in baseline["results"] or baseline["results"][name]["value"] == 0:
+            continue
+        change = new["value"] / baseline["results"][name]["value"] - 1
+        changes[name] = change if new["higher_is_better"] else -change
+        if changes[name] < -tolerance:
+            regressions.append(name)
+    return changes, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the game engine, neural network & genetic algorithm")
+    parser.add_argument("--output", default="benchmark-results.json", help="file the results are written to")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown counted as a regression")
+    parser.add_argument("--quick", action="store_true", help="run smaller benchmarks")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to time")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    warnings.filterwarnings("ignore")   # overflow warnings from the random benchmark genomes
+
+    results = run_benchmarks(args.quick, args.workers)
+    with open(args.output, "w") as results_file:
+        json.dump(results, results_file, indent=1)
+
+    for name, value in results["results"].items():
+        print(f"{name:45} {value['value']:>16.2f} {value['unit']}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            changes, regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for name, change in changes.items():
+            print(f"{name:45} {change:+8.1%}{'  REGRESSION' if name in regressions else ''}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import functools
+import random
+import numpy as np
+from game import take_cell, release_cell, start_snake
+import sensors
+
+
+@functools.lru_cache(maxsize=None)
+def board_masks(XSIZE, YSIZE):
+    '''Returns the bitboard of the wall cells, the offset of every sensor direction as a change of cell index, and
+        the bitboard of the cells along the ray from every cell in every direction (not including the cell itself),
+        indexed as rays[direction][cell]. Only depends on the board size so it is only calculated once per size.'''
+    walls = 0
+    for y in range(YSIZE):
+        for x in range(XSIZE):
+            if y in (0, YSIZE - 1) or x in (0, XSIZE - 1):
+                walls |= 1 << (y * XSIZE + x)
+
+    offsets, rays = {}, {}
+    for direction, (dy, dx) in sensors.direction_offsets.items():
+        offsets[direction] = dy * XSIZE + dx
+        rays[direction] = []
+        for y in range(YSIZE):
+            for x in range(XSIZE):
+                ray, ray_y, ray_x = 0, y + dy, x + dx
+                while 0 <= ray_y < YSIZE and 0 <= ray_x < XSIZE:
+                    ray |= 1 << (ray_y * XSIZE + ray_x)
+                    ray_y, ray_x = ray_y + dy, ray_x + dx
+                rays[direction].append(ray)
+    return walls, offsets, rays
+
+
+class Body:
+    """Read only view of the snake in a BitboardSnake as [ypos, xpos] coordinates, head first, so code written for
+        the list of coordinates in Snake can read it"""
+
+    def __init__(self, snake):
+        self.game = snake
+
+    def __len__(self):
+        return self.game.length
+
+    def __getitem__(self, index):
+        game = self.game
+        if not -game.length <= index < game.length:
+            raise IndexError("snake segment index out of range")
+        return list(divmod(game.ring[(game.head_index - index % game.length) % len(game.ring)], game.XSIZE))
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+class BitboardSnake:
+    """Snake game with the same rules, food placement and sensor values as Snake, but holding the board as bitboards
+        (Python integers with one bit per cell, in row major order): the snake body, the walls and the food. The
+        cells of the snake are kept in a ring buffer so moving only touches the head & tail, the sensors are shifts
+        & masks of the bitboards, and the whole state is a few integers that are cheap to copy, compare or hash (see
+        state & fingerprint)."""
+
+    def __init__(self, _XSIZE, _YSIZE):
+        """Creates the bitboards for the board size and starts a game"""
+        self.XSIZE = _XSIZE
+        self.YSIZE = _YSIZE
+        self.walls, self.offsets, self.rays = board_masks(self.XSIZE, self.YSIZE)
+        self.direction_offsets = {direction: self.offsets[direction] for direction in ("up", "down", "left", "right")}
+        self.wall_distances = sensors.wall_distance_table(self.XSIZE, self.YSIZE)
+        # Cells that food can be placed in & their index in that list, the same as Snake so the same cells are chosen
+        self.food_cells = [y * self.XSIZE + x for y in range(1, self.YSIZE-1) for x in range(1, self.XSIZE-1)]
+        self.food_positions = [-1] * (self.XSIZE * self.YSIZE)
+        for position, cell in enumerate(self.food_cells):
+            self.food_positions[cell] = position
+        self.snake = Body(self)
+        self.reset()
+
+    def reset(self, seed=None, starve_steps=None):
+        """Resets the game after a run has finished, the same as Snake.reset"""
+        self.rng = random if seed is None else random.Random(seed)
+        self.starve_steps = self.XSIZE * self.YSIZE * 1.5 if starve_steps is None else starve_steps
+        # Ring buffer of the snake cells (longer than the longest possible snake), head at head_index
+        self.ring = [0] * (self.XSIZE * self.YSIZE + 1)
+        self.body = 0
+        self.free_cells, self.free_positions = self.food_cells[:], self.food_positions[:]
+        start = [y * self.XSIZE + x for y, x in reversed(start_snake(self.XSIZE, self.YSIZE))]   # tail first
+        self.ring[:len(start)] = start
+        self.head_index, self.tail_index, self.length = len(start) - 1, 0, len(start)
+        for cell in reversed(start):
+            self.occupy(cell)
+        self.head = start[-1]
+        self.collided = False
+        self.food = self.place_food()
+        self.snake_direction = "right"
+        self.time_until_starve = self.starve_steps
+
+    def occupy(self, cell):
+        """Sets the bit of a cell entered by the snake, taking it from the free cells"""
+        self.body |= 1 << cell
+        if self.food_positions[cell] >= 0:
+            take_cell(self.free_cells, self.free_positions, cell)
+
+    def vacate(self, cell):
+        """Clears the bit of a cell left by the snake, returning it to the free cells"""
+        self.body &= ~(1 << cell)
+        if self.food_positions[cell] >= 0:
+            release_cell(self.free_cells, self.free_positions, cell)
+
+    def place_food(self):
+        """Randomly places the food in one of the cells not taken up by the snake"""
+        self.food_cell = self.free_cells[self.rng.randrange(len(self.free_cells))]
+        self.food = list(divmod(self.food_cell, self.XSIZE))
+        return self.food
+
+    def update_snake_position(self):
+        """Moves the head of the snake one cell in its direction"""
+        self.head += self.direction_offsets[self.snake_direction]
+        self.head_index = (self.head_index + 1) % len(self.ring)
+        self.ring[self.head_index] = self.head
+        self.collided = bool(self.body >> self.head & 1)
+        if not self.collided:
+            self.occupy(self.head)
+
+    def food_eaten(self):
+        """Returns True if the head is on the food, otherwise moves the tail forward and returns False"""
+        if self.head == self.food_cell:
+            self.length += 1
+            self.time_until_starve = self.starve_steps
+            return True
+        self.time_until_starve -= 1
+        tail = self.ring[self.tail_index]
+        self.tail_index = (self.tail_index + 1) % len(self.ring)
+        if tail == self.head:
+            self.collided = False   # the head moved into the cell the tail just left
+        else:
+            self.vacate(tail)
+        return False
+
+    def snake_turns_into_self(self):
+        """Returns True if the head moved into the body"""
+        return self.collided
+
+    def snake_hit_wall(self):
+        """Returns True if the head moved into a wall"""
+        return bool(self.walls >> self.head & 1)
+
+    def state(self):
+        """Returns the state of the game as a small tuple of integers (body bitboard, food cell, steps until starving
+            and the snake cells from the tail to the head), e.g. for storing large numbers of states"""
+        length = self.length
+        cells = [self.ring[(self.tail_index + i) % len(self.ring)] for i in range(length)]
+        return (self.body, self.food_cell, self.time_until_starve) + tuple(cells)
+
+    def fingerprint(self):
+        """Returns a hash of the snake (body, head & tail) and food. Without eating the snake can only come back to
+            the same fingerprint by going around a loop, so repeated fingerprints between meals show a cycle."""
+        return hash((self.body, self.head, self.ring[self.tail_index], self.food_cell))
+
+    def copy(self):
+        """Returns an independent copy of the game (sharing the random number generator)"""
+        game = object.__new__(BitboardSnake)
+        game.__dict__.update(self.__dict__)
+        game.ring, game.free_cells, game.free_positions = self.ring[:], self.free_cells[:], self.free_positions[:]
+        game.snake = Body(game)
+        return game
+
+    # Sensor Functions
+    def obstacle_check(self, cell):
+        """Returns 0 if the cell is a wall or part of the snake, otherwise 1"""
+        return 0 if (self.walls | self.body) >> cell & 1 else 1
+
+    def distance_to_wall(self, direction):
+        """Returns the distance to the wall in a given direction"""
+        return self.wall_distances[direction][self.head // self.XSIZE][self.head % self.XSIZE]
+
+    def distance_to_tail(self, direction):
+        """Returns the shortest distance in a given direction to the snakes tail, infinity if tail not in the
+            direction. The nearest segment along the ray is the lowest set bit for directions that increase the cell
+            index and the highest for those that decrease it."""
+        hits, offset = self.body & self.rays[direction][self.head], self.offsets[direction]
+        if not hits:
+            return np.inf
+        nearest = (hits & -hits).bit_length() - 1 if offset > 0 else hits.bit_length() - 1
+        return (nearest - self.head) // offset - 1
+
+    def distance_to_food(self, direction):
+        """Returns the shortest distance in a given direction to the food, infinity if food not in the direction"""
+        if not self.rays[direction][self.head] >> self.food_cell & 1:
+            return np.inf
+        return (self.food_cell - self.head) // self.offsets[direction] - 1
+
+    def local_sensors(self, directions):
+        """Returns whether the adjacent cell in each direction is free of obstacles (1 or 0), followed by whether it
+            contains the food"""
+        cells = [self.head + self.offsets[direction] for direction in directions]
+        return [self.obstacle_check(cell) for cell in cells] + [cell == self.food_cell for cell in cells]
+
+    def global_sensors(self, directions):
+        """Returns the distance to the wall in each direction, followed by the distance to the tail and to the food"""
+        return [self.distance_to_wall(direction) for direction in directions] + \
+            [self.distance_to_tail(direction) for direction in directions] + \
+            [self.distance_to_food(direction) for direction in directions]
+
+    def food_direction(self):
+        """Returns 1 if the food coordinate is greater than the snakes head, 0 if equal, -1 if less, for the x & y
+            axis"""
+        (head_y, head_x), (food_y, food_x) = divmod(self.head, self.XSIZE), divmod(self.food_cell, self.XSIZE)
+        return [(food_x > head_x) - (food_x < head_x), (food_y > head_y) - (food_y < head_y)]
+
+    # Bitboard equivalent of each group in sensors.sensor_groups
+    sensor_groups = {
+        "local_straight": lambda self: self.local_sensors(sensors.straight_directions),
+        "local_diagonal": lambda self: self.local_sensors(sensors.diagonal_directions),
+        "global_straight": lambda self: self.global_sensors(sensors.straight_directions),
+        "global_diagonal": lambda self: self.global_sensors(sensors.diagonal_directions),
+        "food_direction": food_direction,
+    }
+
+    def features(self, algorithm):
+        """Returns a function that builds the inputs to the network for the algorithm variant from this game"""
+        functions = [self.sensor_groups[group] for group in sensors.feature_specs[algorithm]]
+
+        def features(snake):
+            inputs = []
+            for function in functions:
+                inputs += function(snake)
+            return inputs
+        return features
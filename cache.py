@@ -0,0 +1,51 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+
+class FitnessCache:
+    '''Least recently used cache of fitness values, keyed by a hash of the genome together with the configuration
+        of the evaluation (algorithm, board size, game seeds etc.) so an individual is only ever played once for the
+        same games'''
+
+    def __init__(self, max_size):
+        '''Creates an empty cache that holds up to max_size fitness values'''
+        self.max_size = max_size
+        self.fitnesses = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def key(self, genome, config):
+        '''Returns the key for a genome evaluated with the given configuration'''
+        digest = hashlib.blake2b(np.asarray(genome, dtype=float).tobytes(), digest_size=16).digest()
+        return digest, config
+
+    def evaluate(self, individuals, evaluate_population, config):
+        '''Returns the fitness of each individual, only calling evaluate_population (once, as a batch, with the
+            indexes of the individuals) for the genomes that are not already cached'''
+        keys = [self.key(individual, config) for individual in individuals]
+        results, missing = {}, {}
+        for index, key in enumerate(keys):
+            if key in results or key in missing:
+                self.hits += 1      # duplicate of a genome already seen in this batch
+            elif key in self.fitnesses:
+                self.fitnesses.move_to_end(key)
+                results[key] = self.fitnesses[key]
+                self.hits += 1
+            else:
+                missing[key] = index
+                self.misses += 1
+
+        fitnesses = evaluate_population(list(missing.values())) if missing else []
+        for key, fitness in zip(missing, fitnesses):
+            results[key] = fitness
+            self.fitnesses[key] = fitness
+            if len(self.fitnesses) > self.max_size:
+                self.fitnesses.popitem(last=False)
+
+        return [results[key] for key in keys]
+
+    def counts(self):
+        '''Returns the number of cache hits & misses since the last call and resets them'''
+        counts = {"cache_hits": self.hits, "cache_misses": self.misses}
+        self.hits, self.misses = 0, 0
+        return counts
@@ -0,0 +1,89 @@
+import os
+import pickle
+import struct
+import zlib
+
+# Every checkpoint is appended to the stream as a frame: magic, crc32 of the payload, payload length, then the
+# pickled payload (replay.py uses the same framing with its own magic). A frame cut short by a crash fails its
+# length/crc check and is ignored (then overwritten by the next append), so only complete checkpoints are ever read
+# back.
+frame_magic = b"SGCK"
+frame_header = struct.Struct("<4sIQ")
+
+
+def read_frames(path, magic=frame_magic):
+    '''Returns the payload of every complete frame in the stream, along with the offset where the last one ends'''
+    payloads, end = [], 0
+    if not os.path.exists(path):
+        return payloads, end
+    with open(path, "rb") as stream:
+        while True:
+            header = stream.read(frame_header.size)
+            if len(header) < frame_header.size:
+                break
+            frame_start, crc, length = frame_header.unpack(header)
+            payload = stream.read(length)
+            if frame_start != magic or len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            payloads.append(payload)
+            end = stream.tell()
+    return payloads, end
+
+
+def drop_torn_frame(path, magic=frame_magic):
+    '''Truncates an incomplete frame left at the end of the stream by a crash, so the next frame is appended after
+        the last complete one'''
+    _, end = read_frames(path, magic)
+    if os.path.exists(path) and os.path.getsize(path) > end:
+        with open(path, "r+b") as stream:
+            stream.truncate(end)
+
+
+def append_frames(path, payloads, magic=frame_magic):
+    '''Appends a frame for each payload to the stream, flushing them to disk before returning'''
+    with open(path, "ab") as stream:
+        for payload in payloads:
+            stream.write(frame_header.pack(magic, zlib.crc32(payload), len(payload)) + payload)
+        stream.flush()
+        os.fsync(stream.fileno())
+
+
+class CheckpointStream:
+    '''Append-only stream of genetic algorithm checkpoints. Each checkpoint holds the full population state needed to
+        resume (genome matrix, fitness values, RNG states) but only the logbook rows recorded since the previous
+        checkpoint, so writing one never rewrites earlier data.'''
+
+    def __init__(self, path, logged=0):
+        '''Opens the stream, dropping any incomplete frame left at the end by a crash. logged is the number of
+            logbook rows already held by the checkpoints in the stream.'''
+        self.path = path
+        self.logged = logged
+        drop_torn_frame(path)
+
+    def checkpoints(self):
+        '''Returns every complete checkpoint in the stream, oldest first'''
+        return read_checkpoints(self.path)
+
+    def append(self, state, logbook):
+        '''Appends a checkpoint of the state along with the logbook rows recorded since the last checkpoint. The
+            frame is flushed to disk before returning.'''
+        state = dict(state, logbook=[dict(record) for record in logbook[self.logged:]])
+        append_frames(self.path, [pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)])
+        self.logged = len(logbook)
+
+
+def read_checkpoints(path):
+    '''Returns every complete checkpoint in a stream, oldest first. The stream is only read, never truncated, so it
+        is safe to call while a run is appending to it.'''
+    return [pickle.loads(payload) for payload in read_frames(path)[0]]
+
+
+def load_checkpoint(path):
+    '''Returns the state of the latest complete checkpoint in a stream, with the logbook rows of every checkpoint up
+        to it joined together, without changing the stream'''
+    checkpoints = read_checkpoints(path)
+    if not checkpoints:
+        raise ValueError(f"No complete checkpoint found in {path}")
+    state = checkpoints[-1]
+    state["logbook"] = [record for checkpoint in checkpoints for record in checkpoint["logbook"]]
+    return state
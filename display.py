@@ -0,0 +1,95 @@
+import turtle
+import time
+from game import run_game
+
+
+class DisplayGame:
+    """Class for displaying the game when HEADLESS is set to False"""
+
+    def __init__(self, XSIZE, YSIZE):
+        """Initializes all aspects of the game including the board, snake and 
+            food pellets."""
+        self.XSIZE = XSIZE
+        self.YSIZE = YSIZE
+
+        # SCREEN
+        self.win = turtle.Screen()
+        self.win.title("EVAC Snake game")
+        self.win.bgcolor("grey")
+        self.win.setup(width=(XSIZE*20)+40, height=(YSIZE*20)+40)
+        self.win.tracer(0)
+
+        # Snake Head
+        self.head = turtle.Turtle()
+        self.head.shape("square")
+        self.head.color("black")
+
+        # Snake food
+        self.food = turtle.Turtle()
+        self.food.shape("circle")
+        self.food.color("red")
+        self.food.penup()
+        self.food.shapesize(0.55, 0.55)
+        self.segments = []
+
+    def reset(self, snake):
+        """Resets the display when the game is first ran"""
+        self.segments = []
+        self.head.penup()
+        self.food.goto(-500, -500)
+        self.head.goto(-500, -500)
+        for i in range(len(snake)-1):
+            self.add_snake_segment()
+        self.update_segment_positions(snake)
+
+    def screen_position(self, coord):
+        """Returns the screen position of a [ypos, xpos] grid coordinate, with the board centred in the window"""
+        return (coord[1] - self.XSIZE // 2) * 20, (self.YSIZE // 2 - coord[0]) * 20 - 10
+
+    def update_food(self, new_food):
+        """Updates/draws food to the display"""
+        self.food.goto(self.screen_position(new_food))
+
+    def update_segment_positions(self, snake):
+        """Updates/draws each segment of the snake to the display"""
+        self.head.goto(self.screen_position(snake[0]))
+        for i in range(len(self.segments)):
+            self.segments[i].goto(self.screen_position(snake[i+1]))
+
+    def add_snake_segment(self):
+        """Draws and adds a new snake segment to the display"""
+        self.new_segment = turtle.Turtle()
+        self.new_segment.speed(0)
+        self.new_segment.shape("square")
+        # TODO: Change back to random colour generation before submission
+        self.new_segment.color("green")
+        self.new_segment.penup()
+        self.segments.append(self.new_segment)
+
+    def show_frame(self, snake, food):
+        """Draws a recorded frame (snake & food positions), adding segments as the snake grows"""
+        while len(self.segments) < len(snake) - 1:
+            self.add_snake_segment()
+        self.update_food(food)
+        self.update_segment_positions(snake)
+        self.win.update()
+
+    def replay(self, frames, delay=0.001, close=True):
+        """Shows the recorded frames of a game one after the other, waiting delay seconds between each, then closes
+            the window unless close is False"""
+        self.reset(frames[0][0])
+        for snake, food in frames:
+            self.show_frame(snake, food)
+            time.sleep(delay)     # Change to change update rate of the game
+
+        if close:
+            turtle.done()
+            turtle.bye()
+
+
+def play_game(display, snake_game, network, algorithm, seed=None, delay=0.001):
+    '''Plays a game with run_game then shows it on the display, returning the score'''
+    frames = []
+    score = run_game(snake_game, network, algorithm, seed, frames=frames)
+    display.replay(frames, delay)
+    return score
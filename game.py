@@ -1,65 +1,34 @@
-import turtle
 import random
 import time
 import numpy as np
+from collections import deque
+from profiling import add_timings
+import sensors
 
 
-class DisplayGame:
-    """Class for displaying the game when HEADLESS is set to False"""
-
-    def __init__(self, XSIZE, YSIZE):
-        """Initializes all aspects of the game including the board, snake and 
-            food pellets."""
-        # SCREEN
-        self.win = turtle.Screen()
-        self.win.title("EVAC Snake game")
-        self.win.bgcolor("grey")
-        self.win.setup(width=(XSIZE*20)+40, height=(YSIZE*20)+40)
-        self.win.tracer(0)
-
-        # Snake Head
-        self.head = turtle.Turtle()
-        self.head.shape("square")
-        self.head.color("black")
-
-        # Snake food
-        self.food = turtle.Turtle()
-        self.food.shape("circle")
-        self.food.color("red")
-        self.food.penup()
-        self.food.shapesize(0.55, 0.55)
-        self.segments = []
-
-    def reset(self, snake):
-        """Resets the display when the game is first ran"""
-        self.segments = []
-        self.head.penup()
-        self.food.goto(-500, -500)
-        self.head.goto(-500, -500)
-        for i in range(len(snake)-1):
-            self.add_snake_segment()
-        self.update_segment_positions(snake)
-
-    def update_food(self, new_food):
-        """Updates/draws food to the display"""
-        self.food.goto(((new_food[1]-9)*20)+20, (((9-new_food[0])*20)-10)-20)
-
-    def update_segment_positions(self, snake):
-        """Updates/draws each segment of the snake to the display"""
-        self.head.goto(((snake[0][1]-9)*20)+20, (((9-snake[0][0])*20)-10)-20)
-        for i in range(len(self.segments)):
-            self.segments[i].goto(((snake[i+1][1]-9)*20)+20,
-                                  (((9-snake[i+1][0])*20)-10)-20)
-
-    def add_snake_segment(self):
-        """Draws and adds a new snake segment to the display"""
-        self.new_segment = turtle.Turtle()
-        self.new_segment.speed(0)
-        self.new_segment.shape("square")
-        # TODO: Change back to random colour generation before submission
-        self.new_segment.color("green")
-        self.new_segment.penup()
-        self.segments.append(self.new_segment)
+def take_cell(free_cells, cell_positions, cell):
+    """Removes a cell from a list of free cells in constant time by moving the last free cell into its place, keeping
+        cell_positions (the index of every cell in the list, -1 if it is not free) up to date"""
+    position = cell_positions[cell]
+    last = free_cells.pop()
+    if last != cell:
+        free_cells[position] = last
+        cell_positions[last] = position
+    cell_positions[cell] = -1
+
+
+def release_cell(free_cells, cell_positions, cell):
+    """Adds a cell to the end of a list of free cells, keeping cell_positions up to date"""
+    cell_positions[cell] = len(free_cells)
+    free_cells.append(cell)
+
+
+def start_snake(XSIZE, YSIZE):
+    """Returns the initial snake co-ordinates [ypos, xpos] for the board size, head first: a straight snake along
+        the middle row heading right from the left wall, 11 segments long (shortened to leave room ahead of the
+        head on narrow boards). On the 16x16 board this is the snake from [8, 10] to [8, 0]."""
+    length = max(2, min(11, XSIZE - 5))
+    return [[YSIZE // 2, x] for x in range(length - 1, -1, -1)]
 
 
 class Snake:
@@ -69,52 +38,90 @@ class Snake:
         """Draws and adds a new snake segment to the display"""
         self.XSIZE = _XSIZE
         self.YSIZE = _YSIZE
+        self.rng = random
+        # Cells (row major index) that food can be placed in (everything inside the walls), and the index of each
+        # cell in that list (-1 for the walls)
+        self.food_cells = [y * self.XSIZE + x for y in range(1, self.YSIZE-1) for x in range(1, self.XSIZE-1)]
+        self.food_positions = [-1] * (self.XSIZE * self.YSIZE)
+        for position, cell in enumerate(self.food_cells):
+            self.food_positions[cell] = position
         self.reset()
-        self.direction_offsets = {"up": [-1, 0], "down": [+1, 0],
-                                  "left": [0, -1], "right": [0, +1],
-                                  "upright": [-1, +1], "downright": [+1, +1],
-                                  "upleft": [-1, -1], "downleft": [+1, -1]}
-
-    def reset(self):
-        """Resets the game after a run has finished"""
-        self.snake = [[8, 10], [8, 9], [8, 8], [8, 7], [8, 6], [8, 5], [8, 4],  # Initial snake co-ordinates [ypos,xpos]
-                      [8, 3], [8, 2], [8, 1], [8, 0]]
+        self.direction_offsets = {direction: list(offset) for direction, offset in sensors.direction_offsets.items()}
+
+    def reset(self, seed=None, starve_steps=None):
+        """Resets the game after a run has finished. If a seed is provided the food is placed using its own random
+            stream so the same game can be played again, otherwise the global random module is used. starve_steps
+            sets how many steps the snake can go without food (XSIZE*YSIZE*1.5 if None)."""
+        self.rng = random if seed is None else random.Random(seed)
+        self.starve_steps = self.XSIZE * self.YSIZE * 1.5 if starve_steps is None else starve_steps
+        self.snake = deque(start_snake(self.XSIZE, self.YSIZE))  # Initial snake co-ordinates [ypos,xpos]
+        # Number of snake segments in each cell (row major), the cells inside the walls not taken up by the snake
+        # (with the index of each cell in that list), and bitmasks of the occupied cells along every row, column &
+        # diagonal (indexed by position along the line), kept up to date as the snake moves
+        self.occupancy = bytearray(self.XSIZE * self.YSIZE)
+        self.free_cells, self.free_positions = self.food_cells[:], self.food_positions[:]
+        self.rows, self.columns = [0] * self.YSIZE, [0] * self.XSIZE
+        self.diagonals, self.antidiagonals = [0] * (self.XSIZE + self.YSIZE - 1), [0] * (self.XSIZE + self.YSIZE - 1)
+        for segment in self.snake:
+            self.add_segment(segment)
         self.food = self.place_food()
         self.snake_direction = "right"
-        self.time_until_starve = self.XSIZE * self.YSIZE * 1.5
+        self.time_until_starve = self.starve_steps
 
     def place_food(self):
-        """Randomly generates a location for the food, and regenerates it if 
-            spawned inside the snake"""
-        self.food = [random.randint(1, (self.YSIZE-2)),
-                     random.randint(1, (self.XSIZE-2))]
-        while (self.food in self.snake):
-            self.food = [random.randint(
-                1, (self.YSIZE-2)), random.randint(1, (self.XSIZE-2))]
+        """Randomly places the food in one of the cells not taken up by the snake"""
+        self.food = list(divmod(self.free_cells[self.rng.randrange(len(self.free_cells))], self.XSIZE))
         return(self.food)
 
+    def add_segment(self, coord):
+        """Adds a snake segment at the coordinate to the occupancy grid, free cells & line bitmasks"""
+        cell = coord[0] * self.XSIZE + coord[1]
+        self.occupancy[cell] += 1
+        if self.occupancy[cell] == 1:
+            self.toggle_line_bits(coord)
+            if self.food_positions[cell] >= 0:
+                take_cell(self.free_cells, self.free_positions, cell)
+
+    def remove_segment(self, coord):
+        """Removes a snake segment at the coordinate from the occupancy grid, free cells & line bitmasks"""
+        cell = coord[0] * self.XSIZE + coord[1]
+        self.occupancy[cell] -= 1
+        if self.occupancy[cell] == 0:
+            self.toggle_line_bits(coord)
+            if self.food_positions[cell] >= 0:
+                release_cell(self.free_cells, self.free_positions, cell)
+
+    def toggle_line_bits(self, coord):
+        """Flips the bit of the coordinate in the bitmasks of its row, column & both diagonals"""
+        y, x = coord
+        self.rows[y] ^= 1 << x
+        self.columns[x] ^= 1 << y
+        self.diagonals[y - x + self.XSIZE - 1] ^= 1 << x
+        self.antidiagonals[y + x] ^= 1 << x
+
     def update_snake_position(self):
         """Adds the new coordinate of the snakes head to the front of the snake coordinate list."""
-        self.snake.insert(0, [self.snake[0][0] + (self.snake_direction == "down" and 1) +
-                              (self.snake_direction == "up" and -1),
-                              self.snake[0][1] + (self.snake_direction == "left" and -1) +
-                              (self.snake_direction == "right" and 1)])
+        self.snake.appendleft([self.snake[0][0] + (self.snake_direction == "down" and 1) +
+                               (self.snake_direction == "up" and -1),
+                               self.snake[0][1] + (self.snake_direction == "left" and -1) +
+                               (self.snake_direction == "right" and 1)])
+        self.add_segment(self.snake[0])
 
     def food_eaten(self):
         """Returns True if snakes head coordinate is the same as the food location, otherwise removes the oldest 
             coordinate in the snake coordinate list (as a new one will be added for the movement of the head) 
                 and returns False."""
         if self.snake[0] == self.food:
-            self.time_until_starve = self.XSIZE * self.YSIZE * 1.5
+            self.time_until_starve = self.starve_steps
             return True
         else:
             self.time_until_starve -= 1
-            self.snake.pop()  # snake moves forward and so last tail item is removed
+            self.remove_segment(self.snake.pop())  # snake moves forward and so last tail item is removed
             return False
 
     def snake_turns_into_self(self):
         """Returns True if new snakes head coordinate is already in the body, otherwise False"""
-        if self.snake[0] in self.snake[1:]:
+        if self.occupancy[self.snake[0][0] * self.XSIZE + self.snake[0][1]] > 1:
             return True
         else:
             return False
@@ -127,6 +134,10 @@ class Snake:
         else:
             return False
 
+    def features(self, algorithm):
+        """Returns a function that builds the inputs to the network for the algorithm variant from this game"""
+        return sensors.compile_features(algorithm)
+
     # Sensor Functions
     def get_adj_coords(self):
         """Returns dictionary of adjacent coordinates to the snakes head"""
@@ -147,7 +158,8 @@ class Snake:
 
     def sense_tail(self, coord):
         """Returns True if coordinate is a part of the snake, otherwise False"""
-        return coord in self.snake
+        return 0 <= coord[0] < self.YSIZE and 0 <= coord[1] < self.XSIZE and \
+            self.occupancy[coord[0] * self.XSIZE + coord[1]] > 0
 
     def obstacle_check(self, coord):
         """Returns 0 if a tail or wall is found in a given direction, otherwise 1"""
@@ -174,108 +186,60 @@ class Snake:
     def distance_to_tail(self, direction):
         """Returns the shortest distance in a given direction to the snakes tail, returns infinity if tail not in 
             the direction."""
-        checked_coord = self.snake[0]
-        distance, tail_found = 0, False
-        while not tail_found:
-            checked_coord = [checked_coord[0]+self.direction_offsets[direction]
-                             [0], checked_coord[1]+self.direction_offsets[direction][1]]
-            if self.sense_tail(checked_coord):
-                return distance
-            elif self.sense_wall(checked_coord):
-                return np.inf
-            distance += 1
+        return sensors.distance_to_tail(self, direction)
 
     def distance_to_wall(self, direction):
         """Returns the distance to the wall in a given direction"""
-        checked_coord = self.snake[0]
-        distance, wall_not_found = 0, False
-        while not wall_not_found:
-            checked_coord = [checked_coord[0]+self.direction_offsets[direction]
-                             [0], checked_coord[1]+self.direction_offsets[direction][1]]
-            if self.sense_wall(checked_coord):
-                return distance
-            distance += 1
+        return sensors.distance_to_wall(self, direction)
 
     def distance_to_food(self, direction):
         """Returns the shortest distance in a given direction to the food, returns infinity if food not in the 
             direction."""
-        checked_coord = self.snake[0]
-        distance, wall_not_found = 0, False
-        while not wall_not_found:
-            checked_coord = [checked_coord[0]+self.direction_offsets[direction]
-                             [0], checked_coord[1]+self.direction_offsets[direction][1]]
-            if self.sense_food(checked_coord):
-                return distance
-            elif self.sense_wall(checked_coord):
-                return np.inf
-            distance += 1
-
-
-def run_game(display, snake_game, headless, network, algorithm):
-    '''Runs through a game simulation, using the neural network to make decisions on the snakes movement.
-        Returns the final score the snake achieved before a loss condition was met.'''
+        return sensors.distance_to_food(self, direction)
+
 
-    # Resets the score, game & display
+def run_game(snake_game, network, algorithm, seed=None, detect_cycles=False, starve_steps=None, timings=None,
+             frames=None, actions=None, table=None):
+    '''Runs through a game simulation, using the neural network to make decisions on the snakes movement.
+        Returns the final score the snake achieved before a loss condition was met. Providing a seed makes the
+        food placement (and so the score) reproducible. Setting detect_cycles ends the game as soon as the snake
+        repeats a (head, direction, length, food) state, as it is then treated as looping until it starves.
+        starve_steps sets how many steps the snake can go without food. If a timings dictionary is provided the
+        seconds spent sensing, in the network and updating the game are added to it. If a frames list is provided
+        the snake & food positions at the start and after every step are added to it, so the game can be shown
+        afterwards (see display.py). If an actions list is provided the direction chosen every step (index into
+        possible_directions) is added to it, which is all that is needed to replay the game (see replay.py). If an
+        action table built by network.actionTable is provided the decisions are looked up in it rather than feeding
+        the network forward every step, which gives the same game.'''
+
+    # Resets the score & game
     score = 0
     steps = 0
-    snake_game.reset()
-    if not headless:
-        display.reset(snake_game.snake)
-        display.win.update()
+    snake_game.reset(seed, starve_steps)
     snake_game.place_food()
     game_over = False
+    features = snake_game.features(algorithm)
+    if table is not None:
+        table, state_index = bytes(np.asarray(table, dtype=np.uint8)), sensors.compile_state_index(algorithm)
+    visited = set()     # (head, direction) states since the food was last eaten, so length & food are the same
+    if frames is not None:
+        frames.append(([segment[:] for segment in snake_game.snake], snake_game.food[:]))
+    start = time.perf_counter() if timings is not None else None
 
     while not game_over:
         steps += 1
-        adj = snake_game.get_adj_coords()
-
-        straight_directions = ["up", "down", "left", "right"]
-        diagonal_directions = ["upleft", "downleft", "upright", "downright"]
-
-        local_straight = [snake_game.obstacle_check(adj[dir]) for dir in straight_directions] + \
-            [snake_game.sense_food(adj[dir]) for dir in straight_directions]
-
-        local_diagonal = [snake_game.obstacle_check(adj[direction]) for direction in diagonal_directions] + \
-            [snake_game.sense_food(adj[direction])
-             for direction in diagonal_directions]
-
-        global_straight = [snake_game.distance_to_wall(direction) for direction in straight_directions] + \
-            [snake_game.distance_to_tail(direction) for direction in straight_directions] + \
-            [snake_game.distance_to_food(direction)
-             for direction in straight_directions]
-
-        global_diagonal = [snake_game.distance_to_wall(direction) for direction in diagonal_directions] + \
-            [snake_game.distance_to_tail(direction) for direction in diagonal_directions] + \
-            [snake_game.distance_to_food(direction)
-             for direction in diagonal_directions]
-
-        food_direction = [snake_game.food_direction(
-            "x"), snake_game.food_direction("y")]
-
-        # Gets softmax output of the neural network decision
-        if algorithm == "a":
-            decision = network.feedForward(local_straight)
-        elif algorithm == "b":
-            decision = network.feedForward(local_straight + food_direction)
-        elif algorithm == "c":
-            decision = network.feedForward(local_straight + local_diagonal)
-        elif algorithm == "d":
-            decision = network.feedForward(
-                local_straight + local_diagonal + food_direction)
-        elif algorithm == "e":
-            decision = network.feedForward(global_straight)
-        elif algorithm == "f":
-            decision = network.feedForward(global_straight + food_direction)
-        elif algorithm == "g":
-            decision = network.feedForward(global_straight + global_diagonal)
-        elif algorithm == "h":
-            decision = network.feedForward(
-                global_straight + global_diagonal + food_direction)
-
-        # Converts softmax output to output direction and sets it
+        inputs = features(snake_game)
+        if timings is not None:
+            start = add_timings(timings, "sense", start)
+
+        # Converts the neural network decision to output direction and sets it
         possible_directions = ["up", "down", "left", "right"]
-        direction = np.argmax(decision)
+        direction = network.decide(inputs) if table is None else table[state_index(inputs)]
         snake_game.snake_direction = possible_directions[direction]
+        if actions is not None:
+            actions.append(direction)
+        if timings is not None:
+            start = add_timings(timings, "network", start)
 
         snake_game.update_snake_position()
 
@@ -283,8 +247,7 @@ def run_game(display, snake_game, headless, network, algorithm):
         if snake_game.food_eaten():
             snake_game.place_food()
             score += 1
-            if not headless:
-                display.add_snake_segment()
+            visited.clear()
 
         # Ends game if the snake runs into itself
         if snake_game.snake_turns_into_self():
@@ -298,16 +261,17 @@ def run_game(display, snake_game, headless, network, algorithm):
         if snake_game.time_until_starve == 0:
             game_over = True
 
-        # Updates display when not running in headless mode
-        if not headless:
-            display.update_food(snake_game.food)
-            display.update_segment_positions(snake_game.snake)
-            display.win.update()
-
-            time.sleep(0.001)     # Change to change update rate of the game
-
-    if not headless:
-        turtle.done()
-        turtle.bye()
+        # Ends game if the snake is back in a state it has already been in without eating
+        if detect_cycles and not game_over:
+            state = (snake_game.snake[0][0], snake_game.snake[0][1], direction)
+            if state in visited:
+                game_over = True
+            visited.add(state)
+
+        # Records the positions for displaying the game afterwards
+        if frames is not None:
+            frames.append(([segment[:] for segment in snake_game.snake], snake_game.food[:]))
+        if timings is not None:
+            start = add_timings(timings, "update", start)
 
     return score
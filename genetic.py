@@ -1,52 +1,185 @@
 from enums import Experiment, ExperimentType
 from game import run_game
+from batch_game import run_games
+from parallel import ParallelEvaluator
+from cache import FitnessCache
+from halloffame import HallOfFame
+from store import save_simulation_info
+from checkpoint import CheckpointStream, load_checkpoint
+from operators import next_generation
+from profiling import Profiler, timed, export_trace
+from replay import ReplayStream, record_generation
+import sensors
 from deap import base
 from deap import creator
 from deap import tools
+import functools
 import logging
 import random
+import time
 import numpy as np
 import os
-import pickle
 
 
-def evaluate(individual, network, snake_game, algorithm, display, headless):
-    '''Returns the fitness of the individual after receiving the score from the game simulation'''
-    network.setWeightsLinear(
-        individual)   # Load the individual's weights into the neural network
-    score = run_game(display, snake_game, headless, network, algorithm)
+def evaluate(individual, network, snake_game, algorithm, display, headless, seed=None, detect_cycles=False,
+             starve_steps=None, timings=None, table=None):
+    '''Returns the fitness of the individual after receiving the score from the game simulation. Providing the
+        individual's action table plays the game by looking the networks decisions up in it.'''
+    network.bindWeights(
+        individual)   # Load the individual's weights into the neural network (without copying them)
+    frames = None if headless else []
+    score = run_game(snake_game, network, algorithm, seed, detect_cycles, starve_steps, timings, frames, table=table)
+    if frames is not None:
+        display.replay(frames)    # Shows the game on the display when not running in headless mode
     return score,
 
 
+# Functions used to combine the scores of the games played by an individual into its fitness
+aggregates = {"mean": np.mean, "median": np.median, "min": np.min}
+
+
+def evaluate_population(individuals, network, snake_game, algorithm, display, headless, evaluator=None, seeds=None,
+                        aggregate="mean", game_steps=None, detect_cycles=False, starve_steps=None, game_skipped=None,
+                        timings=None, played_seeds=None, rows=None, game_starved=None, action_tables=False):
+    '''Returns the fitness of each individual. If a list of seeds is provided every individual plays the same games
+        (one per seed) and the scores are combined with the aggregate function, otherwise each individual plays one
+        game with its own seed drawn from the global random module, so a seeded run always gives the same
+        fitnesses. Headless runs play all of the games at once as a batch (split over the worker processes of the
+        evaluator if one is provided), adding the (individuals, games) array of step counts to game_steps and of
+        steps skipped by ending looping games early (with detect_cycles) to game_skipped and of whether each game
+        ended by starving to game_starved, otherwise the games are played (and displayed) one at a time.
+        starve_steps sets how many steps a snake can go without food. If a timings dictionary is provided the time
+        spent sensing, in the network and updating the games is added to it. The (individuals, games) array of the
+        seeds played is added to played_seeds if provided. When using an evaluator the individuals must be held in
+        its shared genome buffers, with rows giving their row in them. Setting action_tables plays the games using
+        the action table of each network, built once per individual (see run_games).'''
+    if len(individuals) == 0:
+        return []
+    if seeds is not None:
+        game_seeds = np.tile(np.asarray(seeds, dtype=np.uint64), (len(individuals), 1))
+    else:
+        game_seeds = np.array([[random.getrandbits(32)] for _ in individuals], dtype=np.uint64)
+    num_games = game_seeds.shape[1]
+    if played_seeds is not None:
+        played_seeds.append(game_seeds)
+
+    if not headless:
+        scores = []
+        for individual, individual_seeds in zip(individuals, game_seeds):
+            table = None
+            if action_tables:
+                network.bindWeights(individual)
+                table = network.actionTable(algorithm)
+            scores.append([evaluate(individual, network, snake_game, algorithm, display, headless, int(seed),
+                                    detect_cycles, starve_steps, timings, table)[0] for seed in individual_seeds])
+        scores = np.array(scores)
+    else:
+        if evaluator is not None:
+            scores, steps, skipped, starved = evaluator.evaluate(rows, game_seeds, detect_cycles, starve_steps,
+                                                                 timings)
+        else:
+            genomes = np.repeat(np.asarray(individuals, dtype=float), num_games, axis=0)
+            scores, steps, skipped, starved = run_games(network, genomes, snake_game, algorithm, game_seeds.ravel(),
+                                                        detect_cycles, starve_steps, timings, action_tables)
+        scores = scores.reshape(game_seeds.shape)
+        if game_steps is not None:
+            game_steps.append(steps.reshape(game_seeds.shape))
+        if game_skipped is not None:
+            game_skipped.append(skipped.reshape(game_seeds.shape))
+        if game_starved is not None:
+            game_starved.append(starved.reshape(game_seeds.shape))
+
+    if num_games == 1 and seeds is None:
+        return [(int(score),) for score in scores[:, 0]]
+    return [(float(fitness),) for fitness in aggregates[aggregate](scores, axis=1)]
+
+
+def generation_seeds(eval_games, eval_seed):
+    '''Returns the seeds of the games that every individual plays in a generation (common random numbers), or None
+        if each individual should play its own random game. The seeds are drawn from the global random module every
+        generation, unless an eval_seed is given in which case the same games are played every generation.'''
+    if eval_games is None:
+        return None if eval_seed is None else (eval_seed,)
+    rng = random if eval_seed is None else random.Random(eval_seed)
+    return tuple(rng.getrandbits(32) for _ in range(eval_games))
+
+
+def starvation_window(gen, full_steps, early_starve, early_starve_gens):
+    '''Returns the number of steps a snake can go without food in a generation, growing linearly from early_starve
+        in the first generation to full_steps after early_starve_gens generations (always full_steps if
+        early_starve is None, or straight away if early_starve_gens is 0)'''
+    if early_starve is None or early_starve_gens <= 0:
+        return full_steps
+    return round(early_starve + (full_steps - early_starve) * min(1.0, gen / early_starve_gens))
+
+
+def evaluate_invalid(individuals, toolbox, cache, cache_config, seeds, game_steps, game_skipped=None,
+                     starve_steps=None, timings=None, played_seeds=None, rows=None, game_starved=None):
+    '''Returns the fitness of each individual (a genome matrix) for the games with the given seeds, using the
+        fitness cache when the games are the same for every individual. rows gives the row of each individual in
+        the shared genome buffers of the evaluator, if there is one.'''
+    evaluate_games = functools.partial(toolbox.evaluate_population, seeds=seeds, game_steps=game_steps,
+                                       game_skipped=game_skipped, starve_steps=starve_steps, timings=timings,
+                                       played_seeds=played_seeds, game_starved=game_starved)
+    if cache is not None and seeds is not None:
+        return cache.evaluate(individuals, lambda indexes: evaluate_games(
+            individuals[indexes], rows=None if rows is None else rows[indexes]), cache_config + (seeds, starve_steps))
+    return evaluate_games(individuals, rows=rows)
+
+
+def steps_record(game_steps, game_skipped=None, game_starved=None, starve_saved=0):
+    '''Returns the logbook columns describing how many steps the games of a generation took, how many were skipped
+        by ending looping games early if game_skipped is provided, and how many games starved if game_starved is
+        provided, along with the steps saved by their shortened starvation window (starve_saved steps each)'''
+    steps = np.concatenate([steps.ravel() for steps in game_steps]) if game_steps else np.zeros(0, dtype=int)
+    record = {"games": len(steps), "steps": int(steps.sum()),
+              "steps_mean": float(steps.mean()) if len(steps) else 0.0,
+              "steps_max": int(steps.max()) if len(steps) else 0}
+    if game_steps and game_steps[0].shape[1] > 1:
+        # Mean steps of each of the common games, to show which food sequences take the longest
+        record["steps_per_game"] = np.concatenate(game_steps).mean(axis=0).tolist()
+    if game_skipped is not None:
+        skipped = np.concatenate([skipped.ravel() for skipped in game_skipped]) if game_skipped else np.zeros(0)
+        record["steps_skipped"] = int(skipped.sum())
+        record["cycles"] = int(np.count_nonzero(skipped))
+    if game_starved is not None:
+        starved = np.count_nonzero(np.concatenate([starved.ravel() for starved in game_starved])) \
+            if game_starved else 0
+        record["starved"] = int(starved)
+        record["steps_starve_skipped"] = int(starved * starve_saved)
+    return record
+
+
 def genetic_algorithm(ind_size, network, snake_game, display, headless, gen_num=150, pop_num=1500, mut_prob=0.021, cx_prob=0.15,
-                      exp=Experiment.TEST, exp_type=ExperimentType.FINAL, algorithm="b"):
-    '''Runs the genetic algorithm with the provided parameters and saved the logbook & final population to disk'''
+                      exp=Experiment.TEST, exp_type=ExperimentType.FINAL, algorithm="b", seed=None, workers=1,
+                      eval_seed=None, fitness_cache=0, eval_games=None, eval_aggregate="mean", checkpoint=None,
+                      checkpoint_every=10, resume_from=None, sigma=0.2, tournsize=10, run_num=None,
+                      detect_cycles=False, early_starve=None, early_starve_gens=50, profile=False, profile_trace=None,
+                      replay_file=None, replay_top=1, action_tables=False, hall_of_fame=10):
+    '''Runs the genetic algorithm with the provided parameters and saved the logbook & final population to disk.
+        The options group as follows: seed & workers (reproducible, parallel runs), eval_seed, eval_games &
+        eval_aggregate (which games each individual plays), fitness_cache, checkpoint & resume_from, sigma &
+        tournsize (variation), run_num (save folder), detect_cycles & early_starve (shorter games), profile &
+        profile_trace, replay_file, action_tables (see run_games) and hall_of_fame (see store.load_champions).'''
+    if action_tables:
+        sensors.check_action_tables(algorithm)
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    rng = np.random.default_rng(seed)
+
     # Creates single objective maximizing fitness named FitnessMax
     creator.create("FitnessMax", base.Fitness, weights=(1.0,))
 
     # Creates an individual with a list of attributes using previously created FitnessMax
     creator.create("Individual", list, fitness=creator.FitnessMax)
 
-    # Registers functions to create individuals who's genes are random float values (uniformly distributed between -1 and 1)
-    toolbox = base.Toolbox()
-    toolbox.register("attr_float", random.uniform, -1.0, 1.0)
-    toolbox.register("individual", tools.initRepeat,
-                     creator.Individual, toolbox.attr_float, n=ind_size)
-
     # Registers functions to evaluate individuals
+    toolbox = base.Toolbox()
     toolbox.register("evaluate", evaluate)
 
-    # Registers function to select, mate and mutate individuals
-    toolbox.register("select", tools.selTournament, tournsize=10)
-    toolbox.register("mate", tools.cxOnePoint)
-    toolbox.register("mutate", tools.mutGaussian,
-                     mu=0.0, sigma=0.2, indpb=mut_prob)
-
-    # Registers function to generate initial population
-    toolbox.register("population", tools.initRepeat, list, toolbox.individual)
-
     # Registers the statistics & logbook that will be logged during the GA
-    stats = tools.Statistics(key=lambda ind: ind.fitness.values)
+    stats = tools.Statistics()
     stats.register("mean", np.mean)
     stats.register("std", np.std)
     stats.register("median", np.median)
@@ -54,125 +187,150 @@ def genetic_algorithm(ind_size, network, snake_game, display, headless, gen_num=
     stats.register("max", np.max)
     logbook = tools.Logbook()
 
-    # Initializes population
-    population = toolbox.population(n=pop_num)
-
-    # Calculates the initial fitness values for each individual and sets them
-    fitnesses = [toolbox.evaluate(
-        individual, network, snake_game, algorithm, display, headless) for individual in population]
-    for ind, fit in zip(population, fitnesses):
-        ind.fitness.values = fit
-
-    # Genetic Algorithm
-    for g in range(gen_num):
-        logging.info(f"Running generation {g+1}/{gen_num}")
-
-        # Selects number of individuals equal to population length
-        offspring = toolbox.select(population, len(population))
-        # Includes duplicates so clones all individuals
-        offspring = list(map(toolbox.clone, offspring))
-
-        # Performs crossover on 2 individuals based on previously defined probability
-        for indiv1, indiv2 in zip(offspring[::2], offspring[1::2]):
-            if random.random() < cx_prob:
-                toolbox.mate(indiv1, indiv2)
-                del indiv1.fitness.values
-                del indiv2.fitness.values
-
-        # Mutates offspring based on previously defined probability #TODO: Modify probability/algorithm type?
-        for mutant in offspring:
-            toolbox.mutate(mutant)
-            del mutant.fitness.values   # Deletes old fitness values
-
-        # Recalculates fitness values for mutated offspring
-        invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-        fitnesses = [toolbox.evaluate(
-            individual, network, snake_game, algorithm, display, headless) for individual in invalid_ind]
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
-
-        # Replaces old population with new mutated offspring
-        population[:] = offspring
-
-        # Compiles & records the statistics for the new generation
-        record = stats.compile(population)
-        logbook.record(gen=g, **record)
+    # Fitness values can only be reused between evaluations when every individual plays the same games
+    cache = FitnessCache(fitness_cache) if fitness_cache > 0 else None
+    cache_config = (algorithm, snake_game.XSIZE, snake_game.YSIZE, eval_aggregate, detect_cycles)
+    full_starve = snake_game.XSIZE * snake_game.YSIZE * 1.5
+    profiler = Profiler() if profile else None
+    replays = ReplayStream(replay_file) if replay_file is not None else None
+    hall = HallOfFame(hall_of_fame)
+
+    if resume_from is not None:
+        # Restores the population, random states, logbook & cache from the latest checkpoint
+        state = load_checkpoint(resume_from)
+        genomes, fitness = state["genomes"], state["fitness"]
+        random.setstate(state["random_state"])
+        np.random.set_state(state["numpy_state"])
+        rng.bit_generator.state = state["generator_state"]
+        for record in state["logbook"]:
+            logbook.record(**record)
+        if cache is not None and state["cache"] is not None:
+            cache.fitnesses = state["cache"]
+        hall.entries = state.get("hall_of_fame", [])
+        start_gen = state["gen"] + 1
+    else:
+        # Initializes the population as a genome matrix, one row per individual, who's genes are random float values
+        # (uniformly distributed between -1 and 1)
+        genomes, fitness = rng.uniform(-1.0, 1.0, (pop_num, ind_size)), np.zeros(pop_num)
+        start_gen = 0
+
+    stream = None
+    if checkpoint is not None:
+        # A run only appends to an existing stream when it resumed from it, otherwise two runs would be mixed
+        if checkpoint != resume_from and os.path.exists(checkpoint):
+            raise FileExistsError(f"Checkpoint stream {checkpoint} already exists, resume from it or remove it")
+        stream = CheckpointStream(checkpoint, logged=len(logbook) if checkpoint == resume_from else 0)
+
+    # Starts the worker processes used to evaluate the population, which then holds the population in shared
+    # memory: two genome matrices & fitness vectors, swapping between them each generation
+    evaluator, current = None, 0
+    if headless and workers > 1:
+        evaluator = ParallelEvaluator(workers, snake_game.XSIZE, snake_game.YSIZE, algorithm, ind_size, len(genomes),
+                                      eval_games or 1, action_tables=action_tables)
+        evaluator.genomes[current], evaluator.fitness[current] = genomes, fitness
+        genomes, fitness = evaluator.genomes[current], evaluator.fitness[current]
+    toolbox.register("evaluate_population", evaluate_population, network=network, snake_game=snake_game,
+                     algorithm=algorithm, display=display, headless=headless, evaluator=evaluator,
+                     aggregate=eval_aggregate, detect_cycles=detect_cycles, action_tables=action_tables)
+
+    out = None
+    try:
+        if resume_from is None:
+            # Calculates the initial fitness value of each individual
+            starve_steps = starvation_window(0, full_starve, early_starve, early_starve_gens)
+            rows = np.arange(len(genomes)) if evaluator is not None else None
+            fitnesses = [fit[0] for fit in evaluate_invalid(genomes, toolbox, cache, cache_config,
+                                                            generation_seeds(eval_games, eval_seed), None,
+                                                            starve_steps=starve_steps, rows=rows)]
+            if evaluator is not None:
+                fitness[:] = fitnesses
+            else:
+                fitness = np.array(fitnesses)
+            hall.update(genomes, fitness, -1)
+
+        # Genetic Algorithm
+        for g in range(start_gen, gen_num):
+            logging.info(f"Running generation {g+1}/{gen_num}")
+
+            generation_start = time.perf_counter()
+
+            # Selects, mates & mutates the whole population at once, the offspring inherit the fitness of their
+            # parents. With workers the offspring are bred into the other shared matrix.
+            out = None
+            if evaluator is not None:
+                current = 1 - current
+                out = evaluator.genomes[current], evaluator.fitness[current]
+            genomes, fitness, changed = next_generation(genomes, fitness, rng, cx_prob, mut_prob, sigma, tournsize,
+                                                        profiler.timings if profiler is not None else None, out)
+
+            # Recalculates fitness values for the offspring, only those whose genes were changed when caching
+            invalid = changed if cache is not None else np.ones(len(genomes), dtype=bool)
+            rows = current * len(genomes) + np.flatnonzero(invalid) if evaluator is not None else None
+            game_steps = []
+            game_skipped = [] if detect_cycles else None
+            game_starved = [] if early_starve is not None else None
+            played_seeds = [] if replays is not None else None
+            starve_steps = starvation_window(g, full_starve, early_starve, early_starve_gens)
+            seeds = generation_seeds(eval_games, eval_seed)
+            with timed(profiler, "evaluate"):
+                fitnesses = evaluate_invalid(genomes[invalid], toolbox, cache, cache_config, seeds, game_steps,
+                                             game_skipped, starve_steps,
+                                             profiler.timings if profiler is not None else None, played_seeds, rows,
+                                             game_starved)
+            fitness[invalid] = [fit[0] for fit in fitnesses]
+            hall.update(genomes, fitness, g)
+
+            # Records the games of the fittest individuals (whose seeds are known) to the replay file
+            if replays is not None:
+                if seeds is not None:
+                    candidates = np.arange(len(genomes))
+                    candidate_seeds = np.tile(np.asarray(seeds, dtype=np.uint64), (len(genomes), 1))
+                else:
+                    candidates = np.flatnonzero(invalid)
+                    candidate_seeds = np.concatenate(played_seeds) if played_seeds else \
+                        np.zeros((0, 1), dtype=np.uint64)
+                top = np.argsort(-fitness[candidates], kind="stable")[:replay_top]
+                replays.append(record_generation(network, snake_game, algorithm, genomes[candidates[top]],
+                                                 fitness[candidates[top]], candidate_seeds[top], g, detect_cycles,
+                                                 starve_steps))
+
+            # Compiles & records the statistics for the new generation
+            with timed(profiler, "stats"):
+                record = stats.compile(fitness)
+                record.update(steps_record(game_steps, game_skipped, game_starved, full_starve - starve_steps))
+            if early_starve is not None:
+                record["starve_steps"] = starve_steps
+            if profiler is not None:
+                profiler.add("generation", time.perf_counter() - generation_start)
+                record.update(profiler.record(record["steps"]))
+            if cache is not None:
+                record.update(cache.counts())
+            logbook.record(gen=g, **record)
+
+            if stream is not None and (g + 1) % checkpoint_every == 0:
+                stream.append({"gen": g, "genomes": genomes, "fitness": fitness,
+                               "random_state": random.getstate(), "numpy_state": np.random.get_state(),
+                               "generator_state": rng.bit_generator.state,
+                               "cache": cache.fitnesses if cache is not None else None,
+                               "hall_of_fame": hall.entries}, logbook)
+
+        # Copies the population out of shared memory before it is freed
+        genomes, fitness, out = np.array(genomes), np.array(fitness), None
+    finally:
+        if evaluator is not None:
+            evaluator.close()
+
+    if profile_trace is not None:
+        export_trace(logbook, profile_trace)
+
+    # Only builds the DEAP individuals once the run is finished
+    population = []
+    for genome, fit in zip(genomes.tolist(), fitness.tolist()):
+        population.append(creator.Individual(genome))
+        population[-1].fitness.values = (fit,)
 
     if exp != Experiment.TEST:
         save_simulation_info(logbook, population, gen_num,
-                             pop_num, mut_prob, cx_prob, exp, exp_type, algorithm)
+                             pop_num, mut_prob, cx_prob, exp, exp_type, algorithm, seed, run_num, hall.entries)
 
     return logbook, population
-
-
-def save_simulation_info(logbook, final_population, gen_num, pop_num, indpb, cx, exp, exp_type, algorithm):
-    '''Saves the logbook and population to disk, along with a label to be used when plotting the graphs'''
-    if exp == Experiment.FINAL_ALGORITHM:
-        root_folder = "sim-outputs//final-algorithm"
-    else:
-        root_folder = "sim-outputs//" + exp.value + "-" + exp_type.value + "-experiment"
-    if not os.path.exists(root_folder):
-        os.makedirs(root_folder)
-
-    if exp == Experiment.CXINDPB:
-        parent_folder = root_folder + "//" + "gens-" + str(gen_num) + "-pop-" + str(
-            pop_num) + "-mutprob-" + "{:.3f}".format(indpb) + "-cxprob-" + "{:.3f}".format(cx)
-    elif exp == Experiment.INPUT:
-        parent_folder = root_folder + "//" + "gens-" + \
-            str(gen_num) + "-pop-" + str(pop_num) + "-algorithm-" + algorithm
-    elif exp == Experiment.FINAL_ALGORITHM:
-        parent_folder = root_folder
-
-    if not os.path.exists(parent_folder):
-        os.makedirs(parent_folder)
-
-    run_num, folder_made = 1, False
-    while not folder_made:
-        run_folder = parent_folder + "//run-" + str(run_num)
-        if not os.path.exists(run_folder):
-            os.makedirs(run_folder)
-            folder_made = True
-        else:
-            run_num += 1
-
-    # saves label for graphs
-    label_file = open(run_folder + "//" + "label" + ".pkl", "wb")
-    lb_file = open(run_folder + "//" + "logbook" + ".pkl", "wb")
-    pop_file = open(run_folder + "//" + "final_population" + ".pkl", "wb")
-
-    if exp == Experiment.CXINDPB:
-        pickle.dump("indpb-" + "{:.3f}".format(indpb) +
-                    "-cxprob-" + "{:.3f}".format(cx), label_file)
-    elif exp == Experiment.INPUT:
-        pickle.dump("algorithm-" + algorithm, label_file)
-    elif exp == Experiment.FINAL_ALGORITHM:
-        pickle.dump("algorithm-b", label_file)
-
-    pickle.dump(logbook, lb_file)
-    pickle.dump(final_population, pop_file)
-
-    label_file.close()
-    lb_file.close()
-    pop_file.close()
-
-
-def load_simulation_info(load_loc):
-    '''Loads the pickled simulation info from the disk and returns it in a tuple containing the label, logbook and final population'''
-    creator.create("FitnessMax", base.Fitness, weights=(1.0,))
-    creator.create("Individual", list, fitness=creator.FitnessMax)
-    output = []
-    runs = [load_loc + "//" +
-            run for run in os.listdir(load_loc) if os.path.isdir(load_loc + "//" + run)]
-    for run in runs:
-        label_file = open(run + "//" + "label" + ".pkl", "rb")
-        lb_file = open(run + "//" + "logbook" + ".pkl", "rb")
-        pop_file = open(run + "//" + "final_population" + ".pkl", "rb")
-
-        output.append((pickle.load(label_file),
-                       pickle.load(lb_file),
-                       pickle.load(pop_file)))
-
-        label_file.close()
-        lb_file.close()
-        pop_file.close()
-    return output
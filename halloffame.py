@@ -0,0 +1,43 @@
+import numpy as np
+
+
+class HallOfFame:
+    '''The fittest distinct genomes seen at any point of a run (not only those that survive to the final
+        population), up to size of them, each with its fitness & the generation it was first seen in (-1 for the
+        initial population). Entries are kept fittest first, earlier entries first among equal fitness.'''
+
+    def __init__(self, size):
+        '''Creates an empty hall of fame that holds up to size genomes'''
+        self.size = size
+        self.entries = []
+
+    def update(self, genomes, fitness, gen):
+        '''Adds the individuals of a generation that are fitter than the least fit entry (or while there is room),
+            skipping genomes that are already held. Only the fittest size individuals of the generation are looked
+            at, so this costs the same however large the population is.'''
+        if self.size <= 0 or len(fitness) == 0:
+            return
+        fitness = np.asarray(fitness, dtype=float)
+        top = np.arange(len(fitness))
+        if len(fitness) > self.size:
+            top = np.argpartition(-fitness, self.size - 1)[:self.size]
+        top = top[np.lexsort((top, -fitness[top]))]
+
+        self.merge({"genome": np.array(genomes[index], dtype=float), "fitness": float(fitness[index]),
+                    "generation": gen} for index in top)
+
+    def merge(self, entries):
+        '''Adds the entries (dictionaries of genome, fitness & generation, e.g. from another hall of fame) that are
+            fitter than the least fit entry held (or while there is room), skipping genomes that are already held'''
+        if self.size <= 0:
+            return
+        held = {entry["genome"].tobytes() for entry in self.entries}
+        for entry in entries:
+            key = np.asarray(entry["genome"], dtype=float).tobytes()
+            if key in held or (len(self.entries) == self.size and entry["fitness"] <= self.entries[-1]["fitness"]):
+                continue
+            held.add(key)
+            position = sum(1 for held_entry in self.entries if held_entry["fitness"] >= entry["fitness"])
+            self.entries.insert(position, entry)
+            if len(self.entries) > self.size:
+                held.discard(self.entries.pop()["genome"].tobytes())
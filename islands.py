@@ -0,0 +1,161 @@
+from enums import Experiment, ExperimentType
+from game import Snake
+from network import generate_neural_net
+from genetic import evaluate_population, generation_seeds, steps_record
+from operators import next_generation
+from halloffame import HallOfFame
+from store import save_simulation_info
+from deap import base
+from deap import creator
+from deap import tools
+import logging
+import multiprocessing
+import random
+import numpy as np
+
+# Islands each island receives migrants from: name -> function(island, number of islands) returning the sources
+topologies = {
+    "ring": lambda island, islands: [(island - 1) % islands],
+    "fully_connected": lambda island, islands: [other for other in range(islands) if other != island],
+}
+
+# Statistics recorded for every island and for the whole population each generation
+statistics = {"mean": np.mean, "std": np.std, "median": np.median, "min": np.min, "max": np.max}
+
+
+def emigrants(genomes, fitness, migrants):
+    '''Returns the genomes & fitness of the fittest individuals of an island'''
+    fittest = np.argsort(-fitness, kind="stable")[:migrants]
+    return genomes[fittest], fitness[fittest]
+
+
+def island_worker(connection, island_seed, ind_size, pop_num, XSIZE, YSIZE, algorithm, mut_prob, cx_prob, sigma,
+                  tournsize, migrants, eval_games, eval_seed, eval_aggregate, hall_of_fame=10):
+    '''Evolves one island inside its own process with its own game, network and random streams. Waits for commands
+        from the main process: ("evolve", generations, immigrant genomes, immigrant fitness) replaces the worst
+        individuals with the immigrants then evolves the island, sending back the fitness vector & game steps of
+        every generation along with its migrants fittest individuals as emigrants; ("finish",) sends back the island's
+        genome matrix, fitness vector & hall of fame entries and stops the process.'''
+    snake_game, network = Snake(XSIZE, YSIZE), generate_neural_net(algorithm)[1]
+    random.seed(int(island_seed.generate_state(1)[0]))
+    rng = np.random.default_rng(island_seed)
+
+    def evaluate(genomes, game_steps):
+        fitnesses = evaluate_population(genomes, network, snake_game, algorithm, None, True,
+                                        seeds=generation_seeds(eval_games, eval_seed), aggregate=eval_aggregate,
+                                        game_steps=game_steps)
+        return np.array([fit[0] for fit in fitnesses])
+
+    genomes = rng.uniform(-1.0, 1.0, (pop_num, ind_size))
+    fitness = evaluate(genomes, None)
+    hall, gen = HallOfFame(hall_of_fame), 0
+    hall.update(genomes, fitness, -1)
+
+    while True:
+        command = connection.recv()
+        if command[0] == "finish":
+            connection.send((genomes, fitness, hall.entries))
+            break
+
+        _, generations, immigrants, immigrant_fitness = command
+        if len(immigrants):
+            worst = np.argsort(fitness, kind="stable")[:len(immigrants)]
+            genomes[worst], fitness[worst] = immigrants, immigrant_fitness
+
+        history = []
+        for _ in range(generations):
+            genomes, fitness, _ = next_generation(genomes, fitness, rng, cx_prob, mut_prob, sigma, tournsize)
+            game_steps = []
+            fitness = evaluate(genomes, game_steps)
+            hall.update(genomes, fitness, gen)
+            gen += 1
+            history.append((fitness.copy(), game_steps))
+        connection.send((history,) + emigrants(genomes, fitness, migrants))
+
+
+def island_record(island_fitness, island_steps):
+    '''Returns the logbook record of one generation: the statistics of the whole population, the same statistics
+        for every island (as one list per statistic, indexed by island) and the game steps of all the islands'''
+    population_fitness = np.concatenate(island_fitness)
+    record = {name: function(population_fitness) for name, function in statistics.items()}
+    for name, function in statistics.items():
+        record["island_" + name] = [function(fitness).item() for fitness in island_fitness]
+    record.update(steps_record([steps for game_steps in island_steps for steps in game_steps]))
+    return record
+
+
+def island_algorithm(ind_size, XSIZE, YSIZE, islands=4, gen_num=150, pop_num=1500, mut_prob=0.021, cx_prob=0.15,
+                     exp=Experiment.TEST, exp_type=ExperimentType.FINAL, algorithm="b", seed=None,
+                     migration_interval=10, migrants=5, topology="ring", eval_seed=None, eval_games=None,
+                     eval_aggregate="mean", sigma=0.2, tournsize=10, hall_of_fame=10):
+    '''Runs the genetic algorithm as an island model: the population of pop_num individuals is split into islands
+        sub-populations which each evolve headless in their own process with the same operators as
+        genetic_algorithm. Every migration_interval generations the migrants fittest individuals of each island
+        are copied to the islands connected to it by the topology ("ring" sends them to the next island,
+        "fully_connected" sends them to every other island which keeps the fittest migrants it receives),
+        replacing their least fit individuals. Migrants are sent between processes as genome & fitness arrays.
+
+        Providing a seed makes the run reproducible (each island gets its own random streams spawned from it). The
+        logbook records the statistics of the whole population along with island_mean, island_max etc. lists
+        holding the statistics of every island. The final population is saved to disk the same as
+        genetic_algorithm and returned with the logbook, and the hall_of_fame fittest genomes seen on any island
+        are merged into the champion index of the experiment.'''
+    if topology not in topologies:
+        raise ValueError(f"Unknown topology {topology}")
+
+    island_seeds = np.random.SeedSequence(seed).spawn(islands)
+    island_sizes = [len(part) for part in np.array_split(np.arange(pop_num), islands)]
+    connections, processes = [], []
+    for island in range(islands):
+        parent_connection, child_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=island_worker, daemon=True, args=(
+            child_connection, island_seeds[island], ind_size, island_sizes[island], XSIZE, YSIZE, algorithm,
+            mut_prob, cx_prob, sigma, tournsize, migrants, eval_games, eval_seed, eval_aggregate, hall_of_fame))
+        process.start()
+        connections.append(parent_connection)
+        processes.append(process)
+
+    logbook = tools.Logbook()
+    outgoing = [(np.zeros((0, ind_size)), np.zeros(0)) for _ in range(islands)]
+    for epoch_start in range(0, gen_num, migration_interval):
+        generations = min(migration_interval, gen_num - epoch_start)
+        logging.info(f"Running generations {epoch_start+1}-{epoch_start+generations}/{gen_num} on {islands} islands")
+
+        for island, connection in enumerate(connections):
+            sources = topologies[topology](island, islands)
+            immigrants = np.concatenate([outgoing[source][0] for source in sources])
+            immigrant_fitness = np.concatenate([outgoing[source][1] for source in sources])
+            immigrants, immigrant_fitness = emigrants(immigrants, immigrant_fitness, migrants)
+            connection.send(("evolve", generations, immigrants, immigrant_fitness))
+
+        results = [connection.recv() for connection in connections]
+        for gen in range(generations):
+            record = island_record([history[gen][0] for history, _, _ in results],
+                                   [history[gen][1] for history, _, _ in results])
+            logbook.record(gen=epoch_start + gen, **record)
+        outgoing = [(genomes, fitness) for _, genomes, fitness in results]
+
+    for connection in connections:
+        connection.send(("finish",))
+    final = [connection.recv() for connection in connections]
+    for process in processes:
+        process.join()
+
+    # Creates single objective maximizing fitness named FitnessMax
+    creator.create("FitnessMax", base.Fitness, weights=(1.0,))
+
+    # Creates an individual with a list of attributes using previously created FitnessMax
+    creator.create("Individual", list, fitness=creator.FitnessMax)
+
+    population, hall = [], HallOfFame(hall_of_fame)
+    for genomes, fitness, hall_entries in final:
+        hall.merge(hall_entries)
+        for genome, fit in zip(genomes.tolist(), fitness.tolist()):
+            population.append(creator.Individual(genome))
+            population[-1].fitness.values = (fit,)
+
+    if exp != Experiment.TEST:
+        save_simulation_info(logbook, population, gen_num,
+                             pop_num, mut_prob, cx_prob, exp, exp_type, algorithm, seed, hall_of_fame=hall.entries)
+
+    return logbook, population
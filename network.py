@@ -1,4 +1,18 @@
 import numpy as np
+import sensors
+
+
+def relu(x):
+    '''Vectorised ReLU activation. NaN values are set to 0, the same as max(0, x)'''
+    return np.where(x > 0, x, 0.0)
+
+
+def output_argmax(output):
+    '''Returns the index of the highest output along the last axis, which is the same as the argmax of its softmax
+        without having to calculate it. Outputs containing NaN or infinity produce an all NaN softmax whose argmax
+        is 0, so they are given 0 as well.'''
+    valid = np.isfinite(np.max(output, axis=-1))
+    return np.where(valid, np.argmax(output, axis=-1), 0)
 
 
 class NeuralNetwork(object):
@@ -14,68 +28,121 @@ class NeuralNetwork(object):
         self.numHidden2 = numHidden2
         self.numOutput = numOutput
 
-        self.w_i_h1 = np.random.randn(
-            self.numHidden1-self.biasNode, self.numInput)
-        self.w_h1_h2 = np.random.randn(self.numHidden2, self.numHidden1)
-        self.w_h2_o = np.random.randn(self.numOutput, self.numHidden2)
+        # Start, end & shape of each layer's weights within the genome
+        self.layerSlices = []
+        start = 0
+        for shape in self.weightShapes():
+            self.layerSlices.append((start, start + shape[0] * shape[1], shape))
+            start += shape[0] * shape[1]
 
-        self.ReLU = lambda x: max(0, x)
+        # Draws the random weights of every layer in one buffer (the same values as drawing each layer in turn)
+        self.bindWeights(np.random.randn(start))
+
+        self.ReLU = relu
 
     def softmax(self, x):
         '''Returns elements from last layer of network as a probability distribution which adds up to 1'''
         e_x = np.exp(x - np.max(x))
         return e_x / e_x.sum()
 
-    def feedForward(self, inputs):
-        '''Takes the inputs & weights and processes the softmax output of the neural network'''
-        inputsBias = inputs[:]                  # copies input array
-        # adds bias value for hidden layer 1
-        inputsBias.append(1)
-
-        h1 = np.dot(self.w_i_h1, inputsBias)    # feed input to hidden layer 1
-        h1 = [self.ReLU(x) for x in h1]         # activates hidden layer 1
+    def activate(self, inputs):
+        '''Takes the inputs & weights and processes the output layer of the neural network (before softmax)'''
+        # adds bias value for hidden layer 1, feeds input to hidden layer 1 and activates it
+        h1 = self.ReLU(np.dot(self.w_i_h1, np.append(inputs, 1)))
 
-        # add bias value for hidden layer 2
-        h1.append(1)
+        # adds bias value for hidden layer 2, feeds hidden layer 1 to hidden layer 2 and activates it
+        h2 = self.ReLU(np.dot(self.w_h1_h2, np.append(h1, 1)))
 
-        # feed hidden layer 1 to hidden layer 2
-        h2 = np.dot(self.w_h1_h2, h1)
-        h2 = [self.ReLU(x) for x in h2]         # activate hidden layer 2
+        return np.dot(self.w_h2_o, h2)          # feed to output layer
 
-        output = np.dot(self.w_h2_o, h2)        # feed to output layer
-        output = self.softmax(output)
-        return output
+    def feedForward(self, inputs):
+        '''Takes the inputs & weights and processes the softmax output of the neural network'''
+        return self.softmax(self.activate(inputs))
+
+    def decide(self, inputs):
+        '''Returns the index of the output chosen by the network, skipping softmax as only the argmax is needed'''
+        return int(output_argmax(self.activate(inputs)))
+
+    def actionTable(self, algorithm):
+        '''Returns the index of the output chosen by the network for every possible input of the algorithm variant,
+            indexed by state index (see sensors.compile_state_index), so the game can look its decisions up. Raises
+            ValueError for variants that action tables are not used for (see sensors.check_action_tables).'''
+        sensors.check_action_tables(algorithm)
+        return PopulationNetwork(self, self.weights[None]).tabulate(sensors.input_states(algorithm))[0]
+
+    def weightShapes(self):
+        '''Returns the shape of the weight matrix of each layer'''
+        return ((self.numHidden1-self.biasNode, self.numInput), (self.numHidden2, self.numHidden1),
+                (self.numOutput, self.numHidden2))
+
+    def bindWeights(self, weights):
+        '''Binds the network to a contiguous 1-D float buffer of weights, such as a row of a genome matrix or an
+            array on a shared memory block. The weight matrix of each layer is a reshaped view of the buffer, so no
+            weights are copied (and changes to the buffer change the network).'''
+        self.weights = np.asarray(weights, dtype=float)
+        self.w_i_h1, self.w_h1_h2, self.w_h2_o = (self.weights[start:end].reshape(shape)
+                                                  for start, end, shape in self.layerSlices)
 
     def getWeightsLinear(self):
         '''Returns the current weights set in the network'''
-        flat_w_i_h1 = list(self.w_i_h1.flatten())
-        flat_w_h1_h2 = list(self.w_h1_h2.flatten())
-        flat_w_h2_o = list(self.w_h2_o.flatten())
-        return(flat_w_i_h1 + flat_w_h1_h2 + flat_w_h2_o)
+        return self.weights.tolist()
 
     def setWeightsLinear(self, genome):
-        '''Sets the weights for the network'''
-
-        numWeights_I_H1 = (self.numHidden1-self.biasNode) * self.numInput
-        numWeights_H1_H2 = (self.numHidden2) * self.numHidden1
-
-        self.w_i_h1 = np.array(genome[:numWeights_I_H1])
-        self.w_i_h1 = self.w_i_h1.reshape(
-            (self.numHidden1-self.biasNode, self.numInput))
-
-        self.w_h1_h2 = np.array(
-            genome[numWeights_I_H1:(numWeights_H1_H2+numWeights_I_H1)])
-        self.w_h1_h2 = self.w_h1_h2.reshape((self.numHidden2, self.numHidden1))
-
-        self.w_h2_o = np.array(genome[(numWeights_H1_H2+numWeights_I_H1):])
-        self.w_h2_o = self.w_h2_o.reshape((self.numOutput, self.numHidden2))
+        '''Sets the weights for the network to a copy of the genome'''
+        self.bindWeights(np.array(genome, dtype=float))
+
+
+class PopulationNetwork(object):
+    '''Holds the weights of a whole population of networks which share the same structure, stacked so that every
+        network can be fed forward in one call'''
+
+    def __init__(self, network, genomes):
+        '''Builds the stacked weights of each layer from a 2-D genome matrix (one row per individual) using the
+            structure of the provided network'''
+        genomes = np.asarray(genomes, dtype=float)
+        self.numNetworks = len(genomes)
+
+        start = 0
+        self.weights = []
+        for shape in network.weightShapes():
+            end = start + (shape[0] * shape[1])
+            self.weights.append(genomes[:, start:end].reshape((self.numNetworks,) + shape))
+            start = end
+        self.w_i_h1, self.w_h1_h2, self.w_h2_o = self.weights
+
+    def activate(self, inputs, rows=None):
+        '''Feeds an (N, I) input batch through the networks and returns the (N, O) output layers. If rows is given
+            input i is fed to network rows[i], otherwise to network i.'''
+        w_i_h1, w_h1_h2, w_h2_o = self.weights if rows is None else (w[rows] for w in self.weights)
+        bias = np.ones((len(inputs), 1))
+
+        # matmul on stacked matrices gives exactly the same values as NeuralNetwork.activate for each network
+        h1 = relu(np.matmul(w_i_h1, np.hstack((inputs, bias))[:, :, None]))
+        h2 = relu(np.matmul(w_h1_h2, np.concatenate((h1, bias[:, :, None]), axis=1)))
+        return np.matmul(w_h2_o, h2)[:, :, 0]
+
+    def decide(self, inputs, rows=None):
+        '''Returns the (N,) indexes of the outputs chosen by the networks for an (N, I) input batch'''
+        return output_argmax(self.activate(inputs, rows))
+
+    def tabulate(self, states, max_batch=2**18):
+        '''Returns an (N, S) uint8 table of the index of the output chosen by every network for each of the (S, I)
+            inputs. All inputs are fed through a group of networks in one batched matmul (groups of at most
+            max_batch network & input pairs), giving exactly the same decisions as decide.'''
+        inputs = np.hstack((states, np.ones((len(states), 1))))[None, :, :, None]
+        tables = np.empty((self.numNetworks, len(states)), dtype=np.uint8)
+        group = max(1, max_batch // len(states))
+        for start in range(0, self.numNetworks, group):
+            w_i_h1, w_h1_h2, w_h2_o = (w[start:start+group, None] for w in self.weights)
+            h1 = relu(np.matmul(w_i_h1, inputs))
+            h2 = relu(np.matmul(w_h1_h2, np.concatenate((h1, np.ones(h1.shape[:2] + (1, 1))), axis=2)))
+            tables[start:start+group] = output_argmax(np.matmul(w_h2_o, h2)[..., 0])
+        return tables
 
 
 def generate_neural_net(algorithm):
     '''Creates the neural network with the correct amount of inputs depending on the algorithm variant'''
-    input_node_counts = {"a": 8, "b": 10, "c": 16,
-                         "d": 18, "e": 12, "f": 14, "g": 24, "h": 26}
-    num_i = input_node_counts[algorithm]
+    num_i = sensors.input_size(algorithm)
 
     num_h1, num_h2, num_o = 8, 8, 4
     network = NeuralNetwork(num_i, num_h1, num_h2, num_o)
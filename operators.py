@@ -0,0 +1,58 @@
+import time
+import numpy as np
+from profiling import add_timings
+
+
+def tournament_select(fitness, k, tournsize, rng):
+    '''Returns the indexes of k individuals, each the fittest of tournsize aspirants chosen at random (with
+        replacement). Ties go to the first aspirant drawn, the same as tools.selTournament.'''
+    aspirants = rng.integers(0, len(fitness), (k, tournsize))
+    return aspirants[np.arange(k), np.argmax(fitness[aspirants], axis=1)]
+
+
+def one_point_crossover(genomes, cx_prob, rng):
+    '''Performs one point crossover in place on each pair of rows (0 & 1, 2 & 3, ...) with probability cx_prob,
+        swapping the genes after a random point the same as tools.cxOnePoint. Returns a mask of the rows whose
+        genes changed.'''
+    num_pairs, size = len(genomes) // 2, genomes.shape[1]
+    mate = rng.random(num_pairs) < cx_prob
+    points = rng.integers(1, size, num_pairs)
+    swap = (np.arange(size) >= points[:, None]) & mate[:, None]
+
+    first, second = genomes[0:2*num_pairs:2], genomes[1:2*num_pairs:2]
+    differs = (swap & (first != second)).any(axis=1)
+    genomes[0:2*num_pairs:2], genomes[1:2*num_pairs:2] = np.where(swap, second, first), np.where(swap, first, second)
+
+    changed = np.zeros(len(genomes), dtype=bool)
+    changed[0:2*num_pairs:2] = changed[1:2*num_pairs:2] = differs
+    return changed
+
+
+def gaussian_mutation(genomes, mu, sigma, indpb, rng):
+    '''Adds gaussian noise in place to each gene with probability indpb, the same as tools.mutGaussian. Returns a
+        mask of the rows whose genes changed.'''
+    mutate = rng.random(genomes.shape) < indpb
+    genomes[mutate] += rng.normal(mu, sigma, np.count_nonzero(mutate))
+    return mutate.any(axis=1)
+
+
+def next_generation(genomes, fitness, rng, cx_prob, mut_prob, sigma=0.2, tournsize=10, timings=None, out=None):
+    '''Creates the offspring of a population held as a genome matrix & fitness vector using tournament selection,
+        one point crossover and gaussian mutation. Returns the offspring genomes, the fitness they inherited from
+        their parents, and a mask of the offspring whose genes were changed by crossover or mutation. If a timings
+        dictionary is provided the time spent in selection & variation is added to it. The offspring are written
+        into the (genomes, fitness) arrays of out if provided, which must not be the parents.'''
+    start = time.perf_counter() if timings is not None else None
+    parents = tournament_select(fitness, len(genomes), tournsize, rng)
+    if out is not None:
+        offspring, offspring_fitness = np.take(genomes, parents, axis=0, out=out[0]), \
+            np.take(fitness, parents, out=out[1])
+    else:
+        offspring, offspring_fitness = genomes[parents], fitness[parents]
+    if timings is not None:
+        start = add_timings(timings, "select", start)
+    crossed = one_point_crossover(offspring, cx_prob, rng)
+    mutated = gaussian_mutation(offspring, 0.0, sigma, mut_prob, rng)
+    if timings is not None:
+        add_timings(timings, "variation", start)
+    return offspring, offspring_fitness, crossed | mutated
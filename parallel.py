@@ -0,0 +1,152 @@
+import math
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+import numpy as np
+from game import Snake
+from network import generate_neural_net
+from batch_game import run_games
+
+
+def shared_array(block, shape, dtype):
+    '''Returns an array whose data is the buffer of a shared memory block'''
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def shared_worker(tasks, done, blocks, pop_num, ind_size, capacity, XSIZE, YSIZE, algorithm, action_tables=False):
+    '''Worker process loop. The game & network are created and the shared buffers attached once, then each task
+        only names the range of game slots to play (each slot holding the population row & seed of one game), whose
+        results are written straight into the shared buffers. Errors are sent back to the parent rather than ending
+        the worker. A None task stops the worker.'''
+    snake_game = Snake(XSIZE, YSIZE)
+    network = generate_neural_net(algorithm)[1]
+    genomes = shared_array(blocks["genomes"], (2 * pop_num, ind_size), np.float64)
+    rows = shared_array(blocks["rows"], capacity, np.int64)
+    seeds = shared_array(blocks["seeds"], capacity, np.uint64)
+    results = shared_array(blocks["results"], (4, capacity), np.int64)
+
+    for start, end, detect_cycles, starve_steps, profile in iter(tasks.get, None):
+        try:
+            timings = {} if profile else None
+            results[:, start:end] = run_games(network, genomes[rows[start:end]], snake_game, algorithm,
+                                              seeds[start:end], detect_cycles, starve_steps, timings, action_tables)
+            done.put(timings)
+        except Exception as error:
+            done.put(error)
+
+    del genomes, rows, seeds, results
+    for block in blocks.values():
+        block.close()
+
+
+class ParallelEvaluator:
+    '''Evaluates a population over persistent worker processes that share the population with the parent through
+        shared memory. The evaluator owns two genome matrices & fitness vectors (the current generation and the
+        one being bred, see genomes & fitness) which the genetic algorithm uses as its population, so the workers
+        only ever need to be sent the range of game slots to play. The seed of every game is shared along with the
+        row of the genome playing it, so the scores are the same as a serial run with the same seeds no matter
+        which worker plays which game.'''
+
+    def __init__(self, workers, XSIZE, YSIZE, algorithm, ind_size, pop_num, games_per_individual=1,
+                 chunks_per_worker=2, poll_interval=1.0, action_tables=False):
+        '''Creates the shared buffers, with a game slot for each game played by a generation (batches larger than
+            this are played in several rounds), and starts the worker processes. Setting action_tables has the
+            workers play using action tables (see run_games).'''
+        self.workers = workers
+        self.chunks_per_worker = chunks_per_worker
+        self.poll_interval = poll_interval
+        self.pop_num = pop_num
+        self.capacity = capacity = pop_num * games_per_individual
+        self.blocks = {"genomes": shared_memory.SharedMemory(create=True, size=2 * pop_num * ind_size * 8),
+                       "fitness": shared_memory.SharedMemory(create=True, size=2 * pop_num * 8),
+                       "rows": shared_memory.SharedMemory(create=True, size=capacity * 8),
+                       "seeds": shared_memory.SharedMemory(create=True, size=capacity * 8),
+                       "results": shared_memory.SharedMemory(create=True, size=4 * capacity * 8)}
+        self.genomes = shared_array(self.blocks["genomes"], (2, pop_num, ind_size), np.float64)
+        self.fitness = shared_array(self.blocks["fitness"], (2, pop_num), np.float64)
+        self.rows = shared_array(self.blocks["rows"], capacity, np.int64)
+        self.seeds = shared_array(self.blocks["seeds"], capacity, np.uint64)
+        self.results = shared_array(self.blocks["results"], (4, capacity), np.int64)
+
+        self.tasks, self.done = multiprocessing.Queue(), multiprocessing.Queue()
+        worker_blocks = {name: self.blocks[name] for name in ("genomes", "rows", "seeds", "results")}
+        self.processes = [multiprocessing.Process(target=shared_worker, daemon=True,
+                                                  args=(self.tasks, self.done, worker_blocks, pop_num, ind_size,
+                                                        capacity, XSIZE, YSIZE, algorithm, action_tables))
+                          for _ in range(workers)]
+        for process in self.processes:
+            process.start()
+
+    def evaluate(self, rows, game_seeds, detect_cycles=False, starve_steps=None, timings=None):
+        '''Returns the score of each game after the genome in each row of the shared genome buffers (counting both
+            matrices, so the rows of the second matrix start at pop_num) plays the games with the seeds in the
+            matching row of game_seeds, along with the number of steps each game took, the steps skipped by ending
+            looping games early and whether each game ended by starving, all flattened in the same order as
+            game_seeds. If a timings dictionary is provided the time the workers spent in each part of the game loop
+            is added to it (summed over the workers, so it can be more than the wall time).'''
+        game_seeds = np.asarray(game_seeds, dtype=np.uint64)
+        games_per_row = game_seeds.shape[1]
+        game_rows = np.repeat(np.asarray(rows, dtype=np.int64), games_per_row)
+        game_seeds = game_seeds.ravel()
+        results = np.zeros((4, len(game_seeds)), dtype=np.int64)
+        for offset in range(0, len(game_seeds), self.capacity):
+            num_games = min(self.capacity, len(game_seeds) - offset)
+            self.rows[:num_games] = game_rows[offset:offset+num_games]
+            self.seeds[:num_games] = game_seeds[offset:offset+num_games]
+            results[:, offset:offset+num_games] = self.play(num_games, detect_cycles, starve_steps, timings,
+                                                            games_per_row)
+        return results[0], results[1], results[2], results[3].astype(bool)
+
+    def play(self, num_games, detect_cycles, starve_steps, timings, games_per_row=1):
+        '''Has the workers play the first num_games game slots, waiting until every range is done before returning
+            the results. Ranges hold whole multiples of games_per_row, so the games of a genome are played by one
+            worker (which then only builds its action table once). Raises the error of a worker that failed, or a
+            RuntimeError if a worker died.'''
+        chunk_size = max(1, math.ceil(num_games / (self.workers * self.chunks_per_worker)))
+        chunk_size = math.ceil(chunk_size / games_per_row) * games_per_row
+        chunks = range(0, num_games, chunk_size)
+        for start in chunks:
+            self.tasks.put((start, min(start + chunk_size, num_games), detect_cycles, starve_steps,
+                            timings is not None))
+
+        error = None
+        for _ in chunks:
+            while True:
+                try:
+                    chunk_timings = self.done.get(timeout=self.poll_interval)
+                    break
+                except queue.Empty:
+                    if not all(process.is_alive() for process in self.processes):
+                        raise RuntimeError("A worker process stopped while evaluating the population")
+            if isinstance(chunk_timings, Exception):
+                error = chunk_timings
+            elif timings is not None:
+                for section, seconds in chunk_timings.items():
+                    timings[section] = timings.get(section, 0.0) + seconds
+        if error is not None:
+            raise error
+        return self.results[:, :num_games]
+
+    def close(self):
+        '''Stops the worker processes and frees the shared buffers. Arrays taken from genomes or fitness must be
+            copied to be used after closing.'''
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(self.poll_interval * 5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        del self.genomes, self.fitness, self.rows, self.seeds, self.results
+        for block in self.blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                pass    # still viewed by an array, so it is unmapped when the process ends instead
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
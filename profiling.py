@@ -0,0 +1,69 @@
+import csv
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+# Logbook columns written to a profiling trace, along with the generation
+trace_columns = ("time_generation", "time_select", "time_variation", "time_evaluate", "time_stats", "time_tables",
+                 "time_sense", "time_network", "time_update", "steps", "ticks_per_sec", "steps_mean")
+
+
+class Profiler:
+    '''Accumulates the time spent in each named section of a generation. Only created when profiling is switched
+        on, so the code being profiled just checks whether it was given a profiler (or a timings dictionary).'''
+
+    def __init__(self):
+        '''Creates a profiler with no time recorded'''
+        self.timings = {}
+
+    def add(self, section, seconds):
+        '''Adds the seconds to the time spent in a section'''
+        self.timings[section] = self.timings.get(section, 0.0) + seconds
+
+    @contextmanager
+    def section(self, name):
+        '''Times the code run inside the with block as part of the named section'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def record(self, steps):
+        '''Returns the logbook columns for the time recorded since the last call (time_<section> in seconds) along
+            with the number of game ticks played per second of evaluation, and resets the timings'''
+        record = {"time_" + section: seconds for section, seconds in self.timings.items()}
+        evaluate_time = self.timings.get("evaluate", 0.0)
+        record["ticks_per_sec"] = steps / evaluate_time if evaluate_time > 0 else 0.0
+        self.timings = {}
+        return record
+
+
+def timed(profiler, name):
+    '''Returns a context manager timing a section with the profiler, or doing nothing if profiler is None'''
+    return profiler.section(name) if profiler is not None else nullcontext()
+
+
+def add_timings(timings, section, start):
+    '''Adds the time since start to a section of a timings dictionary, returning the current time so consecutive
+        sections can be timed with one clock read each'''
+    now = time.perf_counter()
+    timings[section] = timings.get(section, 0.0) + now - start
+    return now
+
+
+def export_trace(logbook, path):
+    '''Writes the profiling columns of every generation in the logbook to a JSON (if the path ends in .json) or CSV
+        file'''
+    rows = [{"gen": record["gen"], **{column: record[column] for column in trace_columns if column in record}}
+            for record in logbook]
+    if path.endswith(".json"):
+        with open(path, "w") as trace_file:
+            json.dump(rows, trace_file, indent=1, default=float)
+        return
+
+    fieldnames = ["gen"] + [column for column in trace_columns if any(column in row for row in rows)]
+    with open(path, "w", newline="") as trace_file:
+        writer = csv.DictWriter(trace_file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,125 @@
+from game import Snake, run_game
+from checkpoint import read_frames, drop_torn_frame, append_frames
+import struct
+import numpy as np
+
+# A recording is everything needed to play a game again without the network: the board size and food seed, which
+# generation & rank of individual played it, its fitness & score, and the action (index into run_game's directions)
+# taken every tick packed into 2 bits. Each recording is one frame of an append-only stream (see checkpoint.py).
+replay_magic = b"SGRP"
+recording_header = struct.Struct("<HHQIHdII")
+directions = ["up", "down", "left", "right"]
+
+
+def pack_actions(actions):
+    '''Packs a sequence of actions (0-3) into 2 bits each'''
+    actions = np.asarray(actions, dtype=np.uint8)
+    padded = np.zeros(-(-len(actions) // 4) * 4, dtype=np.uint8)
+    padded[:len(actions)] = actions
+    return (padded.reshape(-1, 4) << np.array([0, 2, 4, 6], dtype=np.uint8)).sum(axis=1, dtype=np.uint8).tobytes()
+
+
+def unpack_actions(packed, num_actions):
+    '''Returns the actions packed by pack_actions'''
+    packed = np.frombuffer(packed, dtype=np.uint8)
+    return ((packed[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3).ravel()[:num_actions]
+
+
+def record_game(network, snake_game, algorithm, genome, seed, detect_cycles=False, starve_steps=None):
+    '''Plays the game of a genome with the given seed again and returns its recording (without the generation, rank
+        & fitness, which are filled in by the caller). The game is the same as when the genome was evaluated as long
+        as the same seed and options are used.'''
+    network.bindWeights(genome)
+    actions = []
+    score = run_game(snake_game, network, algorithm, int(seed), detect_cycles, starve_steps, actions=actions)
+    return {"XSIZE": snake_game.XSIZE, "YSIZE": snake_game.YSIZE, "seed": int(seed), "score": score,
+            "actions": np.array(actions, dtype=np.uint8)}
+
+
+def record_generation(network, snake_game, algorithm, genomes, fitness, game_seeds, gen, detect_cycles=False,
+                      starve_steps=None):
+    '''Returns the recordings of every game (one per seed in each row of game_seeds) played by the genomes in a
+        generation, ranked in the order the genomes are given'''
+    recordings = []
+    for rank, (genome, fit, seeds) in enumerate(zip(genomes, fitness, game_seeds)):
+        for seed in seeds:
+            recording = record_game(network, snake_game, algorithm, genome, seed, detect_cycles, starve_steps)
+            recordings.append(dict(recording, gen=gen, rank=rank, fitness=float(fit)))
+    return recordings
+
+
+def encode_recording(recording):
+    '''Returns the bytes of a recording'''
+    header = recording_header.pack(recording["XSIZE"], recording["YSIZE"], recording["seed"], recording["gen"],
+                                   recording["rank"], recording["fitness"], recording["score"],
+                                   len(recording["actions"]))
+    return header + pack_actions(recording["actions"])
+
+
+def decode_recording(payload):
+    '''Returns the recording stored in the bytes'''
+    XSIZE, YSIZE, seed, gen, rank, fitness, score, num_actions = recording_header.unpack_from(payload)
+    return {"XSIZE": XSIZE, "YSIZE": YSIZE, "seed": seed, "gen": gen, "rank": rank, "fitness": fitness,
+            "score": score, "actions": unpack_actions(payload[recording_header.size:], num_actions)}
+
+
+class ReplayStream:
+    '''Append-only file of game recordings'''
+
+    def __init__(self, path):
+        '''Opens the file, dropping any incomplete recording left at the end by a crash'''
+        self.path = path
+        drop_torn_frame(path, replay_magic)
+
+    def append(self, recordings):
+        '''Appends the recordings to the file, flushing them to disk before returning'''
+        append_frames(self.path, [encode_recording(recording) for recording in recordings], replay_magic)
+
+    def recordings(self):
+        '''Returns every complete recording in the file, oldest first'''
+        return read_replays(self.path)
+
+
+def read_replays(path):
+    '''Returns every complete recording in a replay file. The file is only read, never truncated, so it is safe to
+        call while a run is appending to it.'''
+    return [decode_recording(payload) for payload in read_frames(path, replay_magic)[0]]
+
+
+def replay_frames(recording):
+    '''Returns the snake & food positions at the start and after every tick of a recorded game by applying the
+        recorded actions to a new game, without using the network'''
+    snake_game = Snake(recording["XSIZE"], recording["YSIZE"])
+    snake_game.reset(recording["seed"])
+    snake_game.place_food()
+    frames = [([segment[:] for segment in snake_game.snake], snake_game.food[:])]
+    for action in recording["actions"]:
+        snake_game.snake_direction = directions[action]
+        snake_game.update_snake_position()
+        if snake_game.food_eaten():
+            snake_game.place_food()
+        frames.append(([segment[:] for segment in snake_game.snake], snake_game.food[:]))
+    return frames
+
+
+def frame_boards(recording):
+    '''Returns the frames of a recorded game as a (ticks + 1, YSIZE, XSIZE) array with 0 for empty cells, 1 for the
+        snakes body, 2 for its head and 3 for the food'''
+    frames = replay_frames(recording)
+    boards = np.zeros((len(frames), recording["YSIZE"], recording["XSIZE"]), dtype=np.uint8)
+    for board, (snake, food) in zip(boards, frames):
+        for y, x in snake:
+            board[y, x] = 1
+        board[food[0], food[1]] = 3
+        board[snake[0][0], snake[0][1]] = 2
+    return boards
+
+
+def export_frames(recording, path):
+    '''Saves the frames of a recorded game to a .npy file (see frame_boards)'''
+    np.save(path, frame_boards(recording))
+
+
+def play_recording(display, recording, delay=0.001):
+    '''Shows a recorded game on a DisplayGame, waiting delay seconds between each tick'''
+    display.replay(replay_frames(recording), delay)
@@ -0,0 +1,223 @@
+import functools
+import itertools
+import operator
+import numpy as np
+
+# Row/column offset of each direction the snake can sense in [ypos,xpos]
+direction_offsets = {"up": (-1, 0), "down": (+1, 0),
+                     "left": (0, -1), "right": (0, +1),
+                     "upright": (-1, +1), "downright": (+1, +1),
+                     "upleft": (-1, -1), "downleft": (+1, -1)}
+
+straight_directions = ("up", "down", "left", "right")
+diagonal_directions = ("upleft", "downleft", "upright", "downright")
+
+
+@functools.lru_cache(maxsize=None)
+def wall_distance_table(XSIZE, YSIZE):
+    '''Returns the distance to the wall in every direction from every cell of a board, indexed as
+        table[direction][ypos][xpos]. Only depends on the board size so it is only calculated once per size.'''
+    table = {}
+    for direction, (dy, dx) in direction_offsets.items():
+        table[direction] = []
+        for y in range(YSIZE):
+            row = []
+            for x in range(XSIZE):
+                steps_y = y if dy < 0 else (YSIZE - 1 - y) if dy > 0 else np.inf
+                steps_x = x if dx < 0 else (XSIZE - 1 - x) if dx > 0 else np.inf
+                row.append(min(steps_y, steps_x) - 1)
+            table[direction].append(row)
+    return table
+
+
+def distance_to_wall(snake, direction):
+    '''Returns the distance to the wall in a given direction'''
+    head = snake.snake[0]
+    return wall_distance_table(snake.XSIZE, snake.YSIZE)[direction][head[0]][head[1]]
+
+
+def distance_to_food(snake, direction):
+    '''Returns the shortest distance in a given direction to the food, returns infinity if food not in the
+        direction'''
+    head, (dy, dx) = snake.snake[0], direction_offsets[direction]
+    food_y, food_x = snake.food[0] - head[0], snake.food[1] - head[1]
+    steps = max(abs(food_y), abs(food_x))
+    if steps and food_y == dy * steps and food_x == dx * steps:
+        return steps - 1
+    return np.inf
+
+
+def distance_to_tail(snake, direction):
+    '''Returns the shortest distance in a given direction to the snakes tail, returns infinity if tail not in the
+        direction. Uses the bitmask of occupied cells along the row, column or diagonal through the head, so the
+        nearest segment is found without walking the cells.'''
+    y, x = snake.snake[0]
+    if direction in ("up", "down"):
+        line, position = snake.columns[x], y
+    elif direction in ("left", "right"):
+        line, position = snake.rows[y], x
+    elif direction in ("upleft", "downright"):
+        line, position = snake.diagonals[y - x + snake.XSIZE - 1], x
+    else:
+        line, position = snake.antidiagonals[y + x], x
+
+    if direction in ("down", "right", "downright", "upright"):
+        ahead = line >> (position + 1)                  # segments after the head along the line
+        return (ahead & -ahead).bit_length() - 1 if ahead else np.inf
+    behind = line & ((1 << position) - 1)               # segments before the head along the line
+    return position - behind.bit_length() if behind else np.inf
+
+
+def local_sensors(snake, directions):
+    '''Returns whether the adjacent cell in each direction is free of obstacles (1 or 0), followed by whether it
+        contains the food'''
+    head, walls = snake.snake[0], (0, snake.YSIZE - 1)
+    obstacles, food = [], []
+    for direction in directions:
+        dy, dx = direction_offsets[direction]
+        coord = [head[0] + dy, head[1] + dx]
+        blocked = coord[0] in walls or coord[1] in (0, snake.XSIZE - 1) or \
+            snake.occupancy[coord[0] * snake.XSIZE + coord[1]] > 0
+        obstacles.append(0 if blocked else 1)
+        food.append(snake.food == coord)
+    return obstacles + food
+
+
+def global_sensors(snake, directions):
+    '''Returns the distance to the wall in each direction, followed by the distance to the tail and to the food'''
+    return [distance_to_wall(snake, direction) for direction in directions] + \
+        [distance_to_tail(snake, direction) for direction in directions] + \
+        [distance_to_food(snake, direction) for direction in directions]
+
+
+def food_direction(snake):
+    '''Returns 1 if the food coordinate is greater than the snakes head, 0 if equal, -1 if less, for the x & y axis'''
+    head, food = snake.snake[0], snake.food
+    return [(food[1] > head[1]) - (food[1] < head[1]), (food[0] > head[0]) - (food[0] < head[0])]
+
+
+# Sensor groups that can be fed to the network: name -> (number of inputs, function returning them for a snake)
+sensor_groups = {
+    "local_straight": (8, functools.partial(local_sensors, directions=straight_directions)),
+    "local_diagonal": (8, functools.partial(local_sensors, directions=diagonal_directions)),
+    "global_straight": (12, functools.partial(global_sensors, directions=straight_directions)),
+    "global_diagonal": (12, functools.partial(global_sensors, directions=diagonal_directions)),
+    "food_direction": (2, food_direction),
+}
+
+# Lowest & highest value of every input of the sensor groups whose inputs can only be whole numbers in a small range,
+# so every possible input to the network can be listed (see input_states)
+discrete_inputs = {"local_straight": (0, 1), "local_diagonal": (0, 1), "food_direction": (-1, 1)}
+
+# Sensor groups used by each algorithm variant, in the order they are fed to the network
+feature_specs = {
+    "a": ("local_straight",),
+    "b": ("local_straight", "food_direction"),
+    "c": ("local_straight", "local_diagonal"),
+    "d": ("local_straight", "local_diagonal", "food_direction"),
+    "e": ("global_straight",),
+    "f": ("global_straight", "food_direction"),
+    "g": ("global_straight", "global_diagonal"),
+    "h": ("global_straight", "global_diagonal", "food_direction"),
+}
+
+
+def register_algorithm(algorithm, groups):
+    '''Adds a new algorithm variant which feeds the given sensor groups to the network'''
+    for group in groups:
+        if group not in sensor_groups:
+            raise ValueError(f"Unknown sensor group {group}")
+    feature_specs[algorithm] = tuple(groups)
+    compile_features.cache_clear()
+    input_states.cache_clear()
+    compile_state_index.cache_clear()
+
+
+def input_size(algorithm):
+    '''Returns the number of inputs to the network for the algorithm variant'''
+    return sum(sensor_groups[group][0] for group in feature_specs[algorithm])
+
+
+@functools.lru_cache(maxsize=None)
+def compile_features(algorithm):
+    '''Returns a function that builds the inputs to the network for the algorithm variant, only calling the sensors
+        that the variant uses'''
+    functions = [sensor_groups[group][1] for group in feature_specs[algorithm]]
+    if len(functions) == 1:
+        return functions[0]
+
+    def features(snake):
+        inputs = []
+        for function in functions:
+            inputs += function(snake)
+        return inputs
+    return features
+
+
+def feature_vector(snake, algorithm):
+    '''Returns the inputs to the neural network for the algorithm variant in a single list'''
+    return compile_features(algorithm)(snake)
+
+
+def num_states(algorithm):
+    '''Returns the number of different inputs the network can be given for the algorithm variant, or None if any of
+        its sensors are not discrete'''
+    if not all(group in discrete_inputs for group in feature_specs[algorithm]):
+        return None
+    return int(np.prod([(discrete_inputs[group][1] - discrete_inputs[group][0] + 1) ** sensor_groups[group][0]
+                        for group in feature_specs[algorithm]]))
+
+
+def input_ranges(algorithm):
+    '''Returns the lowest & highest value of every input for the algorithm variant'''
+    if num_states(algorithm) is None:
+        raise ValueError(f"Algorithm {algorithm} has sensors that are not discrete")
+    return [discrete_inputs[group] for group in feature_specs[algorithm] for _ in range(sensor_groups[group][0])]
+
+
+# Most possible inputs an action table is built for. Each network is fed every possible input once to build its
+# table, so only "a" (256) and "b" (2304) qualify: the tables of "c" (65536) & "d" (589824) cost far more to build
+# than any game played with them saves.
+max_table_states = 4096
+
+
+def check_action_tables(algorithm):
+    '''Raises ValueError if action tables are not used for the algorithm variant, because it has sensors that are
+        not discrete or more possible inputs than max_table_states'''
+    states = num_states(algorithm)
+    if states is None:
+        raise ValueError(f"Action tables need discrete sensors, which algorithm {algorithm} does not have")
+    if states > max_table_states:
+        raise ValueError(f"Algorithm {algorithm} has {states} possible inputs, action tables are only built for up "
+                         f"to {max_table_states}")
+
+
+@functools.lru_cache(maxsize=None)
+def input_states(algorithm):
+    '''Returns every input the network can be given for the algorithm variant as a (states, inputs) array, in the
+        order of their state index (see compile_state_index). Raises ValueError if any of its sensors are not
+        discrete.'''
+    states = np.array(list(itertools.product(*(range(low, high + 1) for low, high in input_ranges(algorithm)))),
+                      dtype=float)
+    states.flags.writeable = False
+    return states
+
+
+def state_strides(algorithm):
+    '''Returns the weight of each input in the state index and the index of the all-lowest input, so the index of
+        an input is inputs @ strides - base'''
+    ranges = input_ranges(algorithm)
+    strides = [1] * len(ranges)
+    for i in range(len(ranges) - 2, -1, -1):
+        strides[i] = strides[i + 1] * (ranges[i + 1][1] - ranges[i + 1][0] + 1)
+    return strides, sum(stride * low for stride, (low, _) in zip(strides, ranges))
+
+
+@functools.lru_cache(maxsize=None)
+def compile_state_index(algorithm):
+    '''Returns a function giving the index (row of input_states) of the input list built for a snake'''
+    strides, base = state_strides(algorithm)
+
+    def state_index(inputs):
+        return sum(map(operator.mul, inputs, strides)) - base
+    return state_index
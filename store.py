@@ -0,0 +1,243 @@
+from enums import Experiment
+from deap import base
+from deap import creator
+from deap import tools
+import contextlib
+import json
+import os
+import pickle
+import time
+import numpy as np
+
+
+def experiment_folder(exp, exp_type):
+    '''Returns the folder that every run of an experiment is saved in'''
+    if exp == Experiment.FINAL_ALGORITHM:
+        return "sim-outputs//final-algorithm"
+    return "sim-outputs//" + exp.value + "-" + exp_type.value + "-experiment"
+
+
+def alteration_folder(exp, exp_type, gen_num, pop_num, indpb, cx, algorithm):
+    '''Returns the folder that the runs of one alteration (parameter combination) of an experiment are saved in'''
+    root_folder = experiment_folder(exp, exp_type)
+    if exp == Experiment.CXINDPB:
+        return root_folder + "//" + "gens-" + str(gen_num) + "-pop-" + str(
+            pop_num) + "-mutprob-" + "{:.3f}".format(indpb) + "-cxprob-" + "{:.3f}".format(cx)
+    elif exp == Experiment.INPUT:
+        return root_folder + "//" + "gens-" + \
+            str(gen_num) + "-pop-" + str(pop_num) + "-algorithm-" + algorithm
+    return root_folder
+
+
+def run_label(exp, indpb, cx, algorithm):
+    '''Returns the label used for a run when plotting the graphs'''
+    if exp == Experiment.CXINDPB:
+        return "indpb-" + "{:.3f}".format(indpb) + "-cxprob-" + "{:.3f}".format(cx)
+    return "algorithm-" + algorithm
+
+
+def logbook_columns(logbook):
+    '''Returns the numeric columns of the logbook as arrays (one value per generation). Columns that are not numbers
+        or lists of numbers of the same length are skipped.'''
+    keys = []
+    for record in logbook:
+        keys += [key for key in record if key not in keys]
+
+    columns = {}
+    for key in keys:
+        try:
+            column = np.asarray(logbook.select(key))
+        except ValueError:
+            continue
+        if column.dtype.kind in "biuf":
+            columns[key] = column
+    return columns
+
+
+@contextlib.contextmanager
+def folder_lock(path, stale_after=60.0):
+    '''Holds a lock taken by creating a folder (which fails while another process holds it), so concurrent runs
+        update a shared file one at a time. A lock older than stale_after seconds was left by a crash and is
+        taken over.'''
+    while True:
+        try:
+            os.mkdir(path)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale_after:
+                    os.rmdir(path)
+                    continue
+            except OSError:
+                pass    # released (or taken over) by another process in the meantime
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.rmdir(path)
+
+
+def load_champions(exp, exp_type, top=None):
+    '''Returns the fittest individuals found by any run of an experiment from its champion index, fittest first
+        (only the top of them if given), without loading any run. Each is a dictionary of the genome, fitness,
+        generation it was found in, run folder, label & algorithm.'''
+    champions_path = experiment_folder(exp, exp_type) + "//" + "champions" + ".pkl"
+    if not os.path.exists(champions_path):
+        return []
+    with open(champions_path, "rb") as champions_file:
+        return pickle.load(champions_file)[:top]
+
+
+def update_champions(exp, exp_type, champions, max_size=100):
+    '''Merges the hall of fame entries of a run into the champion index of its experiment, keeping the max_size
+        fittest. Entries from an earlier save of the same run folder are replaced.'''
+    champions_path = experiment_folder(exp, exp_type) + "//" + "champions" + ".pkl"
+    runs = {champion["run"] for champion in champions}
+    with folder_lock(champions_path + ".lock"):
+        merged = [champion for champion in load_champions(exp, exp_type) if champion["run"] not in runs]
+        merged = sorted(merged + list(champions), key=lambda champion: -champion["fitness"])[:max_size]
+        with open(champions_path + ".tmp", "wb") as champions_file:
+            pickle.dump(merged, champions_file)
+        os.replace(champions_path + ".tmp", champions_path)
+
+
+def save_simulation_info(logbook, final_population, gen_num, pop_num, indpb, cx, exp, exp_type, algorithm, seed=None,
+                         run_num=None, hall_of_fame=None):
+    '''Saves the run to disk: the logbook statistics as one array per column, the final population as a float32
+        genome matrix with a matching fitness vector, and the run metadata (including the label used when
+        plotting the graphs), which is also appended to the index of the experiment. The run is saved in the
+        run-{run_num} folder if a run number is given, otherwise in the first free run folder of the alteration.
+        The entries of a hall_of_fame (see halloffame.py) are merged into the champion index of the experiment.'''
+    parent_folder = alteration_folder(exp, exp_type, gen_num, pop_num, indpb, cx, algorithm)
+    os.makedirs(parent_folder, exist_ok=True)
+
+    if run_num is not None:
+        run_folder = parent_folder + "//run-" + str(run_num)
+        os.makedirs(run_folder, exist_ok=True)
+    else:
+        # Claims the folder with mkdir, which fails if another process made it first, so concurrent runs never
+        # share a folder
+        run_num = 1
+        while True:
+            run_folder = parent_folder + "//run-" + str(run_num)
+            try:
+                os.mkdir(run_folder)
+                break
+            except FileExistsError:
+                run_num += 1
+
+    np.savez(run_folder + "//" + "stats" + ".npz", **logbook_columns(logbook))
+    np.save(run_folder + "//" + "population" + ".npy", np.asarray(final_population, dtype=np.float32))
+    np.save(run_folder + "//" + "fitness" + ".npy",
+            np.array([ind.fitness.values[0] for ind in final_population], dtype=np.float32))
+
+    metadata = {"run": os.path.relpath(run_folder, experiment_folder(exp, exp_type)),
+                "label": run_label(exp, indpb, cx, algorithm), "exp": exp.value, "exp_type": exp_type.value,
+                "algorithm": algorithm, "mut_prob": float(indpb), "cx_prob": float(cx), "gen_num": gen_num,
+                "pop_num": pop_num, "seed": seed}
+    # run.json is written after the data (and atomically) so its existence marks a complete run, and the run is only
+    # added to the index once it is complete
+    with open(run_folder + "//" + "run" + ".json.tmp", "w") as run_file:
+        json.dump(metadata, run_file)
+    os.replace(run_folder + "//" + "run" + ".json.tmp", run_folder + "//" + "run" + ".json")
+    with open(experiment_folder(exp, exp_type) + "//" + "index" + ".jsonl", "a") as index_file:
+        index_file.write(json.dumps(metadata) + "\n")
+    if hall_of_fame:
+        update_champions(exp, exp_type, [dict(entry, genome=np.asarray(entry["genome"], dtype=np.float32),
+                                              run=metadata["run"], label=metadata["label"], algorithm=algorithm)
+                                         for entry in hall_of_fame])
+    return run_folder
+
+
+def list_runs(load_loc):
+    '''Returns the folder of every completely saved run in the provided location'''
+    return [load_loc + "//" + run for run in sorted(os.listdir(load_loc))
+            if os.path.isdir(load_loc + "//" + run) and is_complete_run(load_loc + "//" + run)]
+
+
+def read_index(exp, exp_type):
+    '''Returns the metadata of every complete run of an experiment from its index without loading the runs. A run
+        saved more than once (e.g. re-run into the same run folder) is only returned once, with its latest
+        metadata.'''
+    index_path = experiment_folder(exp, exp_type) + "//" + "index" + ".jsonl"
+    if not os.path.exists(index_path):
+        return []
+    runs = {}
+    with open(index_path) as index_file:
+        for line in index_file:
+            try:
+                metadata = json.loads(line)
+            except json.JSONDecodeError:
+                continue    # blank, or cut short by a crash while it was written
+            runs.pop(metadata["run"], None)
+            runs[metadata["run"]] = metadata
+    return [metadata for run, metadata in runs.items()
+            if is_complete_run(experiment_folder(exp, exp_type) + "//" + run)]
+
+
+def is_complete_run(run_folder):
+    '''Returns True if a run has been completely saved to the folder'''
+    return os.path.exists(run_folder + "//" + "run" + ".json") or os.path.exists(run_folder + "//" + "label" + ".pkl")
+
+
+def is_legacy_run(run_folder):
+    '''Returns True if the run was saved as pickles by older versions of save_simulation_info'''
+    return not os.path.exists(run_folder + "//" + "stats" + ".npz")
+
+
+def run_fingerprint(run_folder):
+    '''Returns the modification time & size of the files a run is saved in, which change whenever the run is saved
+        again, so a cached result of reading the run can be checked without reading it'''
+    names = ("logbook.pkl", "label.pkl") if is_legacy_run(run_folder) else ("stats.npz", "run.json")
+    return tuple((stat.st_mtime_ns, stat.st_size) for stat in (os.stat(run_folder + "//" + name) for name in names))
+
+
+def load_run_stats(run_folder, columns=None):
+    '''Returns the label of a run and a dictionary of the requested per-generation statistics columns (all columns
+        if None) without loading the population'''
+    if is_legacy_run(run_folder):
+        with open(run_folder + "//" + "label" + ".pkl", "rb") as label_file, \
+                open(run_folder + "//" + "logbook" + ".pkl", "rb") as lb_file:
+            label, logbook = pickle.load(label_file), pickle.load(lb_file)
+        stats = logbook_columns(logbook)
+        return label, {column: stats[column] for column in (columns or stats)}
+
+    with open(run_folder + "//" + "run" + ".json") as run_file:
+        label = json.load(run_file)["label"]
+    with np.load(run_folder + "//" + "stats" + ".npz") as stats:
+        return label, {column: stats[column] for column in (columns or stats.files)}
+
+
+def load_population(run_folder, mmap=True):
+    '''Returns the final genome matrix (memory mapped unless mmap is False) and fitness vector of a run'''
+    if is_legacy_run(run_folder):
+        creator.create("FitnessMax", base.Fitness, weights=(1.0,))
+        creator.create("Individual", list, fitness=creator.FitnessMax)
+        with open(run_folder + "//" + "final_population" + ".pkl", "rb") as pop_file:
+            population = pickle.load(pop_file)
+        return np.asarray(population), np.array([ind.fitness.values[0] for ind in population])
+
+    mmap_mode = "r" if mmap else None
+    return (np.load(run_folder + "//" + "population" + ".npy", mmap_mode=mmap_mode),
+            np.load(run_folder + "//" + "fitness" + ".npy", mmap_mode=mmap_mode))
+
+
+def load_simulation_info(load_loc):
+    '''Loads every run saved in a location and returns a list of tuples containing the label, logbook and final
+        population of each, for code that needs the full DEAP objects'''
+    creator.create("FitnessMax", base.Fitness, weights=(1.0,))
+    creator.create("Individual", list, fitness=creator.FitnessMax)
+    output = []
+    for run in list_runs(load_loc):
+        label, stats = load_run_stats(run)
+        logbook = tools.Logbook()
+        for gen in range(len(stats["gen"])):
+            logbook.record(**{column: values[gen].tolist() for column, values in stats.items()})
+
+        genomes, fitness = load_population(run, mmap=False)
+        population = []
+        for genome, fit in zip(genomes.tolist(), fitness.tolist()):
+            population.append(creator.Individual(genome))
+            population[-1].fitness.values = (fit,)
+        output.append((label, logbook, population))
+    return output
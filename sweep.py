@@ -0,0 +1,96 @@
+from enums import Experiment, ExperimentType
+from game import Snake
+from network import generate_neural_net
+from genetic import genetic_algorithm
+from store import alteration_folder, is_complete_run
+import functools
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import numpy as np
+
+
+def expand_grid(exp, exp_type, gen_num, pop_num, iterations, algorithms=("b",), mut_probs=(0.021,), cx_probs=(0.3,),
+                seed=None):
+    '''Returns a job (dictionary of genetic_algorithm arguments) for every iteration of every combination of the
+        algorithms, mutation & crossover probabilities. Each job saves its run to the run-{iteration} folder of its
+        alteration so the folder is known before it runs. Providing a seed gives every job its own seed derived
+        from it, so the whole sweep is reproducible.'''
+    jobs = []
+    for iteration, algorithm, mut_prob, cx_prob in itertools.product(range(1, iterations + 1), algorithms, mut_probs,
+                                                                     cx_probs):
+        jobs.append({"exp": exp, "exp_type": exp_type, "gen_num": gen_num, "pop_num": pop_num,
+                     "algorithm": algorithm, "mut_prob": float(mut_prob), "cx_prob": float(cx_prob),
+                     "run_num": iteration, "seed": None if seed is None else seed * 1000003 + len(jobs)})
+    return jobs
+
+
+def experiment_jobs(exp, exp_type, gen_num, pop_num, seed=None):
+    '''Returns the jobs of one of the notebook experiments'''
+    if exp == Experiment.CXINDPB and exp_type == ExperimentType.EXPLORATION:
+        return expand_grid(exp, exp_type, gen_num, pop_num, 5, mut_probs=np.arange(0.003, 0.021, 0.006),
+                           cx_probs=np.arange(0.1, 0.5, 0.1), seed=seed)
+    elif exp == Experiment.CXINDPB:
+        return expand_grid(exp, exp_type, gen_num, pop_num, 15, mut_probs=(0.021, 0.015), cx_probs=(0.3,), seed=seed)
+    elif exp == Experiment.INPUT and exp_type == ExperimentType.EXPLORATION:
+        return expand_grid(exp, exp_type, gen_num, pop_num, 5, algorithms=("a", "b", "c", "d", "e", "f", "g", "h"),
+                           seed=seed)
+    elif exp == Experiment.INPUT:
+        return expand_grid(exp, exp_type, gen_num, pop_num, 15, algorithms=("b", "d"), seed=seed)
+    elif exp == Experiment.FINAL_ALGORITHM:
+        return expand_grid(exp, ExperimentType.FINAL_ALGORITHM, gen_num, pop_num, 15, seed=seed)
+    raise ValueError(f"No sweep defined for {exp.value} {exp_type.value} experiment")
+
+
+def job_folder(job):
+    '''Returns the folder the run of a job is saved in'''
+    return alteration_folder(job["exp"], job["exp_type"], job["gen_num"], job["pop_num"], job["mut_prob"],
+                             job["cx_prob"], job["algorithm"]) + "//run-" + str(job["run_num"])
+
+
+def saved_with_job(job):
+    '''Returns True if the complete run saved in the folder of a job was run with the same parameters (generations,
+        population, probabilities, algorithm & seed) as the job. Runs saved by older versions have no metadata to
+        check, so never match.'''
+    run_path = job_folder(job) + "//" + "run" + ".json"
+    if not os.path.exists(run_path):
+        return False
+    with open(run_path) as run_file:
+        metadata = json.load(run_file)
+    return all(metadata.get(key) == job[key] for key in ("gen_num", "pop_num", "algorithm", "seed")) and \
+        (metadata.get("mut_prob"), metadata.get("cx_prob")) == (job["mut_prob"], job["cx_prob"])
+
+
+def run_job(job, XSIZE, YSIZE):
+    '''Runs the genetic algorithm (headless) for a job with its own game and network, returning its run folder'''
+    ind_size, network = generate_neural_net(job["algorithm"])
+    genetic_algorithm(ind_size, network, Snake(XSIZE, YSIZE), None, True, **job)
+    return job_folder(job)
+
+
+def run_sweep(jobs, XSIZE, YSIZE, max_workers=None):
+    '''Runs every job that does not already have a complete run saved, at most max_workers (default every core) at
+        a time in separate processes, and returns the run folders of the jobs completed. Interrupting a sweep and
+        calling this again with the same jobs continues from the jobs that had not finished. Raises FileExistsError
+        without running anything if a job's folder holds a run saved with different parameters (e.g. an earlier
+        sweep of another size), rather than mixing the two in the results.'''
+    pending = [job for job in jobs if not is_complete_run(job_folder(job))]
+    mismatched = [job_folder(job) for job in jobs if is_complete_run(job_folder(job)) and not saved_with_job(job)]
+    if mismatched:
+        raise FileExistsError(f"Found old runs saved with different parameters - please save or delete them: "
+                              f"{', '.join(mismatched)}")
+    logging.info(f"Running {len(pending)}/{len(jobs)} jobs, skipping {len(jobs) - len(pending)} already complete")
+    if not pending:
+        return []
+
+    max_workers = min(max_workers or os.cpu_count(), len(pending))
+    folders = []
+    with multiprocessing.Pool(max_workers) as pool:
+        results = pool.imap_unordered(functools.partial(run_job, XSIZE=XSIZE, YSIZE=YSIZE), pending)
+        for count, folder in enumerate(results, start=1):
+            logging.info(f"> Run complete {folder} - overall completion {count}/{len(pending)}")
+            folders.append(folder)
+    return folders
+
@@ -0,0 +1,51 @@
+'''Checks that checkpointed runs resume exactly and that checkpoint streams survive being read or cut short.
+    Run with: python -m pytest -q'''
+import os
+import pytest
+from checkpoint import CheckpointStream, load_checkpoint, read_checkpoints, frame_header, frame_magic
+from test_equivalence import run, assert_same_run
+
+# Random genomes overflow the activation functions, which is expected
+pytestmark = pytest.mark.filterwarnings("ignore::RuntimeWarning")
+
+
+@pytest.mark.parametrize("options", [{}, {"eval_games": 3, "fitness_cache": 1000}])
+def test_resumed_run_matches_uninterrupted_run(tmp_path, options):
+    '''Resuming from a checkpoint gives the same run as never stopping'''
+    checkpoint = str(tmp_path / "checkpoint.bin")
+    run(gen_num=5, checkpoint=checkpoint, checkpoint_every=2, **options)
+    assert_same_run(run(**options), run(resume_from=checkpoint, **options))
+
+
+def test_reading_does_not_change_stream(tmp_path):
+    '''Loading a stream with a frame still being written leaves the file alone, and the writer drops the torn
+        frame when it next opens the stream'''
+    path = str(tmp_path / "checkpoint.bin")
+    stream = CheckpointStream(path)
+    stream.append({"gen": 0}, [{"gen": 0}])
+    stream.append({"gen": 1}, [{"gen": 0}, {"gen": 1}])
+    with open(path, "ab") as partial:
+        partial.write(frame_header.pack(frame_magic, 0, 1000) + b"\0" * 100)
+    size = os.path.getsize(path)
+
+    assert load_checkpoint(path)["gen"] == 1
+    assert len(read_checkpoints(path)) == 2
+    assert os.path.getsize(path) == size
+
+    CheckpointStream(path, logged=2).append({"gen": 2}, [{"gen": 0}, {"gen": 1}, {"gen": 2}])
+    state = load_checkpoint(path)
+    assert state["gen"] == 2 and [record["gen"] for record in state["logbook"]] == [0, 1, 2]
+
+
+def test_checkpoint_to_another_existing_stream_is_rejected(tmp_path):
+    '''A run never appends to an existing stream other than the one it resumed from'''
+    first, second = str(tmp_path / "first.bin"), str(tmp_path / "second.bin")
+    run(gen_num=3, checkpoint=first, checkpoint_every=1)
+    run(gen_num=3, checkpoint=second, checkpoint_every=1)
+    with pytest.raises(FileExistsError):
+        run(gen_num=5, resume_from=first, checkpoint=second, checkpoint_every=1)
+    with pytest.raises(FileExistsError):
+        run(gen_num=3, checkpoint=first)
+
+    run(gen_num=5, resume_from=first, checkpoint=first, checkpoint_every=1)
+    assert [record["gen"] for record in load_checkpoint(first)["logbook"]] == [0, 1, 2, 3, 4]
@@ -0,0 +1,164 @@
+'''Checks that the faster ways of playing & scoring games (batched, tabled, bitboard, cached) give exactly the same
+    results as the plain ones. Run with: python -m pytest -q'''
+import warnings
+import numpy as np
+import pytest
+from game import Snake, run_game
+from bitboard import BitboardSnake
+from batch_game import run_games
+from network import generate_neural_net
+from genetic import genetic_algorithm
+from enums import Experiment, ExperimentType
+from store import experiment_folder, list_runs, load_run_stats, load_champions
+import visualisation
+import sensors
+
+XSIZE = YSIZE = 16
+
+# Random genomes overflow the activation functions, which is expected
+pytestmark = pytest.mark.filterwarnings("ignore::RuntimeWarning")
+
+
+@pytest.mark.parametrize("algorithm", sorted(sensors.feature_specs))
+@pytest.mark.parametrize("detect_cycles", [False, True])
+def test_batched_games_match_single_games(algorithm, detect_cycles):
+    '''run_games gives the same score & steps as run_game for every genome & seed'''
+    ind_size, network = generate_neural_net(algorithm)
+    genomes = np.random.default_rng(0).uniform(-1.0, 1.0, (40, ind_size))
+    seeds = np.arange(40)
+    scores, steps, _, _ = run_games(network, genomes, Snake(XSIZE, YSIZE), algorithm, seeds, detect_cycles, 100)
+
+    snake_game = Snake(XSIZE, YSIZE)
+    for genome, seed, score, num_steps in zip(genomes, seeds, scores, steps):
+        network.bindWeights(genome)
+        actions = []
+        assert run_game(snake_game, network, algorithm, int(seed), detect_cycles, 100, actions=actions) == score
+        assert len(actions) == num_steps
+
+
+@pytest.mark.parametrize("algorithm", ["a", "b"])
+def test_action_tables_match_network(algorithm):
+    '''Playing from action tables gives the same games as feeding the networks forward'''
+    ind_size, network = generate_neural_net(algorithm)
+    genomes = np.repeat(np.random.default_rng(1).uniform(-1.0, 1.0, (20, ind_size)), 2, axis=0)
+    seeds = np.arange(40)
+    results = run_games(network, genomes, Snake(XSIZE, YSIZE), algorithm, seeds)
+    tabled = run_games(network, genomes, Snake(XSIZE, YSIZE), algorithm, seeds, action_tables=True)
+    assert all(np.array_equal(first, second) for first, second in zip(results, tabled))
+
+    snake_game = Snake(XSIZE, YSIZE)
+    for genome, seed, score in zip(genomes[:10], seeds, results[0]):
+        network.bindWeights(genome)
+        assert run_game(snake_game, network, algorithm, int(seed), table=network.actionTable(algorithm)) == score
+
+
+@pytest.mark.parametrize("algorithm", ["c", "e"])
+def test_action_tables_rejected_for_large_or_continuous_inputs(algorithm):
+    '''Action tables are refused for variants with too many possible inputs or continuous sensors'''
+    ind_size, network = generate_neural_net(algorithm)
+    with pytest.raises(ValueError):
+        run_games(network, np.zeros((2, ind_size)), Snake(XSIZE, YSIZE), algorithm, [0, 1], action_tables=True)
+    with pytest.raises(ValueError):
+        run(action_tables=True, algorithm=algorithm)
+
+
+@pytest.mark.parametrize("algorithm", sorted(sensors.feature_specs))
+def test_bitboard_games_match_snake(algorithm):
+    '''BitboardSnake gives the same game (score & every move) as Snake'''
+    ind_size, network = generate_neural_net(algorithm)
+    snake_game, bitboard_game = Snake(XSIZE, YSIZE), BitboardSnake(XSIZE, YSIZE)
+    for seed, genome in enumerate(np.random.default_rng(2).uniform(-1.0, 1.0, (40, ind_size))):
+        network.bindWeights(genome)
+        moves, bitboard_moves = [], []
+        assert run_game(snake_game, network, algorithm, seed, actions=moves) == \
+            run_game(bitboard_game, network, algorithm, seed, actions=bitboard_moves)
+        assert moves == bitboard_moves
+
+
+@pytest.mark.parametrize("size", [(8, 8), (32, 20), (64, 64)])
+def test_games_match_on_other_board_sizes(size):
+    '''Snake, BitboardSnake & the batched games play the same games on boards other than 16x16'''
+    ind_size, network = generate_neural_net("h")
+    genomes = np.random.default_rng(3).uniform(-1.0, 1.0, (20, ind_size))
+    seeds = np.arange(20)
+    scores, steps, _, _ = run_games(network, genomes, Snake(*size), "h", seeds, starve_steps=200)
+
+    snake_game, bitboard_game = Snake(*size), BitboardSnake(*size)
+    for genome, seed, score, num_steps in zip(genomes, seeds, scores, steps):
+        network.bindWeights(genome)
+        moves, bitboard_moves = [], []
+        assert run_game(snake_game, network, "h", int(seed), starve_steps=200, actions=moves) == score
+        assert run_game(bitboard_game, network, "h", int(seed), starve_steps=200, actions=bitboard_moves) == score
+        assert moves == bitboard_moves and len(moves) == num_steps
+
+
+def run(**options):
+    '''Returns the logbook & final population of a small seeded run'''
+    ind_size, network = generate_neural_net("b")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return genetic_algorithm(ind_size, network, Snake(XSIZE, YSIZE), None, True, **{"gen_num": 8, "pop_num": 60,
+                                                                                       "seed": 3, **options})
+
+
+def assert_same_run(first, second):
+    '''Checks that two runs recorded the same statistics and finished with the same population'''
+    assert [dict(record) for record in first[0]] == [dict(record) for record in second[0]]
+    assert np.array_equal(np.array(first[1]), np.array(second[1]))
+    assert [ind.fitness.values for ind in first[1]] == [ind.fitness.values for ind in second[1]]
+
+
+def test_plot_cache_matches_runs(tmp_path, monkeypatch):
+    '''The plot cache gives the same averages as reading every run, and only reads the runs saved since it was
+        last updated'''
+    monkeypatch.chdir(tmp_path)
+    save_location = experiment_folder(Experiment.INPUT, ExperimentType.EXPLORATION)
+    alteration = save_location + "//" + "gens-3-pop-20-algorithm-b"
+    read = []
+    monkeypatch.setattr(visualisation, "plot_stats", lambda run: read.append(run) or load_run_stats(
+        run, visualisation.plot_columns))
+
+    for seed in range(3):
+        run(gen_num=3, pop_num=20, seed=seed, exp=Experiment.INPUT, exp_type=ExperimentType.EXPLORATION)
+        if seed == 1:
+            visualisation.update_plot_cache(save_location, [alteration], 1)
+    summary = visualisation.update_plot_cache(save_location, [alteration], 1)[alteration]
+
+    assert len(read) == 3
+    run_stats = [load_run_stats(run)[1] for run in list_runs(alteration)]
+    for column in ("mean", "max", "std"):
+        assert np.array_equal(summary[column], np.mean([stats[column] for stats in run_stats], axis=0))
+    assert summary["final"] == [float(stats["mean"][-1]) for stats in run_stats]
+
+
+def test_champion_index_holds_best_individuals(tmp_path, monkeypatch):
+    '''The champion index holds the fittest individual found in any generation of any run, fittest first, and a
+        resumed run finds the same champions as an uninterrupted one'''
+    final = {"exp": Experiment.FINAL_ALGORITHM, "exp_type": ExperimentType.FINAL_ALGORITHM}
+    monkeypatch.chdir(tmp_path)
+    for seed in range(2):
+        run(seed=seed, **final)
+    champions = load_champions(**final)
+    runs = list_runs(experiment_folder(**final))
+    best = max(load_run_stats(run, ["max"])[1]["max"].max() for run in runs)
+
+    assert {champion["run"] for champion in champions} <= {"run-1", "run-2"}
+    assert [champion["fitness"] for champion in champions] == sorted((champion["fitness"] for champion in champions),
+                                                                     reverse=True)
+    assert champions[0]["fitness"] == best or champions[0]["generation"] == -1
+    assert [champion["fitness"] for champion in load_champions(top=1, **final)] == [champions[0]["fitness"]]
+
+    for folder in ("uninterrupted", "resumed"):
+        (tmp_path / folder).mkdir()
+    monkeypatch.chdir(tmp_path / "uninterrupted")
+    run(**final)
+    monkeypatch.chdir(tmp_path / "resumed")
+    run(gen_num=5, checkpoint="checkpoint.bin", checkpoint_every=2)
+    run(resume_from="checkpoint.bin", **final)
+    resumed = load_champions(**final)
+    monkeypatch.chdir(tmp_path / "uninterrupted")
+    uninterrupted = load_champions(**final)
+    assert len(resumed) == len(uninterrupted) == 10
+    for first, second in zip(uninterrupted, resumed):
+        assert (first["fitness"], first["generation"]) == (second["fitness"], second["generation"])
+        assert np.array_equal(first["genome"], second["genome"])
@@ -0,0 +1,52 @@
+'''Checks the island model: seeded runs are reproducible, migrants flow along the topology and every island's
+    statistics are recorded. Run with: python -m pytest -q'''
+import numpy as np
+import pytest
+from network import generate_neural_net
+from islands import island_algorithm, topologies, emigrants, statistics
+
+# Random genomes overflow the activation functions, which is expected
+pytestmark = pytest.mark.filterwarnings("ignore::RuntimeWarning")
+
+
+def island_run(**options):
+    '''Returns the logbook & final population of a small seeded island run'''
+    ind_size = generate_neural_net("b")[0]
+    return island_algorithm(ind_size, 16, 16, **{"islands": 3, "gen_num": 4, "pop_num": 45, "seed": 2,
+                                                 "migration_interval": 2, "migrants": 3, "eval_seed": 9, **options})
+
+
+def records(logbook):
+    '''Returns the records of a logbook as plain dictionaries'''
+    return [dict(record) for record in logbook]
+
+
+def test_seeded_island_runs_are_reproducible():
+    '''The same seed gives the same run, another seed a different one'''
+    first, second, other = island_run(), island_run(), island_run(seed=3)
+    assert records(first[0]) == records(second[0])
+    assert np.array_equal(np.array(first[1]), np.array(second[1]))
+    assert records(first[0]) != records(other[0])
+
+
+def test_every_island_is_recorded():
+    '''Each generation records the statistics of every island next to those of the whole population'''
+    logbook, population = island_run()
+    assert len(logbook) == 4 and len(population) == 45
+    for record in logbook:
+        for name in statistics:
+            assert len(record["island_" + name]) == 3
+        assert record["max"] == max(record["island_max"]) and record["min"] == min(record["island_min"])
+
+
+def test_migrants_follow_topology():
+    '''Migrants are the fittest individuals of an island and go to the islands the topology connects it to, and
+        migrating changes the run'''
+    assert [topologies["ring"](island, 4) for island in range(4)] == [[3], [0], [1], [2]]
+    assert topologies["fully_connected"](1, 4) == [0, 2, 3]
+
+    genomes, fitness = np.arange(10.0)[:, None], np.array([3.0, 9.0, 1.0, 9.0, 5.0, 0.0, 2.0, 8.0, 4.0, 6.0])
+    migrant_genomes, migrant_fitness = emigrants(genomes, fitness, 3)
+    assert migrant_genomes.ravel().tolist() == [1.0, 3.0, 7.0] and migrant_fitness.tolist() == [9.0, 9.0, 8.0]
+
+    assert records(island_run()[0]) != records(island_run(migrants=0)[0])
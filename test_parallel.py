@@ -0,0 +1,28 @@
+'''Checks that evaluating over worker processes gives the same runs as evaluating serially and reports worker errors.
+    Run with: python -m pytest -q'''
+import numpy as np
+import pytest
+from network import generate_neural_net
+from parallel import ParallelEvaluator
+from test_equivalence import run, assert_same_run
+
+# Random genomes overflow the activation functions, which is expected
+pytestmark = pytest.mark.filterwarnings("ignore::RuntimeWarning")
+
+
+@pytest.mark.parametrize("options", [{}, {"eval_games": 3, "fitness_cache": 1000, "detect_cycles": True},
+                                     {"action_tables": True, "eval_games": 3}])
+def test_parallel_run_matches_serial_run(options):
+    '''Evaluating over worker processes gives the same run as evaluating in the main process'''
+    assert_same_run(run(**options), run(workers=2, **options))
+
+
+def test_worker_error_is_raised_in_parent():
+    '''An error in a worker is raised by evaluate instead of leaving the run waiting, and the workers keep going'''
+    ind_size, _ = generate_neural_net("b")
+    with ParallelEvaluator(2, 16, 16, "b", ind_size, 10, poll_interval=0.1) as evaluator:
+        evaluator.genomes[0] = np.random.default_rng(0).uniform(-1.0, 1.0, (10, ind_size))
+        with pytest.raises(IndexError):
+            evaluator.evaluate([0, 1000], [[1], [2]])
+        scores = evaluator.evaluate(np.arange(10), np.arange(10)[:, None])[0]
+        assert len(scores) == 10
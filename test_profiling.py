@@ -0,0 +1,42 @@
+'''Checks the profiling columns recorded by a profiled run and the traces exported from them.
+    Run with: python -m pytest -q'''
+import csv
+import json
+import pytest
+from profiling import export_trace, trace_columns
+from test_equivalence import run
+
+# Random genomes overflow the activation functions, which is expected
+pytestmark = pytest.mark.filterwarnings("ignore::RuntimeWarning")
+
+
+@pytest.mark.parametrize("extension", [".json", ".csv"])
+def test_profiled_run_exports_trace(tmp_path, extension):
+    '''A profiled run writes one row per generation holding the generation and its profiling columns, in both
+        formats'''
+    path = str(tmp_path / ("trace" + extension))
+    logbook, _ = run(gen_num=3, profile=True, profile_trace=path)
+    with open(path, newline="") as trace_file:
+        rows = json.load(trace_file) if extension == ".json" else list(csv.DictReader(trace_file))
+
+    assert [int(row["gen"]) for row in rows] == [0, 1, 2]
+    for row, record in zip(rows, logbook):
+        assert set(row) - {"gen"} <= set(trace_columns)
+        for column in ("time_generation", "time_evaluate", "time_sense", "time_network", "ticks_per_sec", "steps"):
+            assert float(row[column]) == pytest.approx(record[column])
+        assert float(row["time_generation"]) > 0
+
+
+def test_trace_leaves_out_missing_columns(tmp_path):
+    '''Columns a logbook never recorded are not written, and a column missing from some generations is left empty
+        in the CSV'''
+    logbook = [{"gen": 0, "time_evaluate": 1.5, "mean": 2.0}, {"gen": 1, "time_evaluate": 0.5, "steps": 10}]
+    export_trace(logbook, str(tmp_path / "trace.json"))
+    export_trace(logbook, str(tmp_path / "trace.csv"))
+
+    with open(tmp_path / "trace.json") as trace_file:
+        assert json.load(trace_file) == [{"gen": 0, "time_evaluate": 1.5},
+                                         {"gen": 1, "time_evaluate": 0.5, "steps": 10}]
+    with open(tmp_path / "trace.csv", newline="") as trace_file:
+        assert list(csv.DictReader(trace_file)) == [{"gen": "0", "time_evaluate": "1.5", "steps": ""},
+                                                    {"gen": "1", "time_evaluate": "0.5", "steps": "10"}]
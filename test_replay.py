@@ -0,0 +1,67 @@
+'''Checks that recorded games survive the binary replay format and play back the same game.
+    Run with: python -m pytest -q'''
+import os
+import numpy as np
+import pytest
+from game import Snake, run_game
+from network import generate_neural_net
+from replay import (pack_actions, unpack_actions, record_game, encode_recording, decode_recording, replay_frames,
+                    ReplayStream, read_replays, replay_magic)
+from checkpoint import frame_header
+
+# Random genomes overflow the activation functions, which is expected
+pytestmark = pytest.mark.filterwarnings("ignore::RuntimeWarning")
+
+
+@pytest.mark.parametrize("length", [0, 1, 3, 4, 5, 1001])
+def test_packed_actions_round_trip(length):
+    '''Actions of any length (not only multiples of 4) unpack to the actions packed'''
+    actions = np.random.default_rng(length).integers(0, 4, length, dtype=np.uint8)
+    packed = pack_actions(actions)
+    assert len(packed) == -(-length // 4)
+    assert np.array_equal(unpack_actions(packed, length), actions)
+
+
+def recorded_games(num_games):
+    '''Returns recordings of games played by random "b" networks, with their generation, rank & fitness filled in'''
+    ind_size, network = generate_neural_net("b")
+    genomes = np.random.default_rng(0).uniform(-1.0, 1.0, (num_games, ind_size))
+    return [dict(record_game(network, Snake(16, 16), "b", genome, seed, starve_steps=100), gen=seed, rank=0,
+                 fitness=0.5) for seed, genome in enumerate(genomes)]
+
+
+def test_recording_round_trip_replays_score():
+    '''A recording decodes to the same game, and playing its actions back eats the food as often as the score'''
+    for recording in recorded_games(20):
+        decoded = decode_recording(encode_recording(recording))
+        assert {key: value for key, value in decoded.items() if key != "actions"} == \
+            {key: value for key, value in recording.items() if key != "actions"}
+        assert np.array_equal(decoded["actions"], recording["actions"])
+
+        frames = replay_frames(decoded)
+        assert len(frames) == len(recording["actions"]) + 1
+        assert sum(len(after[0]) > len(before[0]) for before, after in zip(frames, frames[1:])) == recording["score"]
+
+
+def test_replay_matches_network_game():
+    '''Playing the recorded actions gives the same positions as the network playing the game'''
+    ind_size, network = generate_neural_net("b")
+    genome = np.random.default_rng(1).uniform(-1.0, 1.0, ind_size)
+    recording = dict(record_game(network, Snake(16, 16), "b", genome, 7), gen=0, rank=0, fitness=0.0)
+    frames = []
+    network.bindWeights(genome)
+    run_game(Snake(16, 16), network, "b", 7, frames=frames)
+    assert replay_frames(recording) == frames
+
+
+def test_reading_does_not_change_stream(tmp_path):
+    '''Reading a replay file with a recording still being written leaves the file alone'''
+    path = str(tmp_path / "replays.bin")
+    recordings = recorded_games(3)
+    ReplayStream(path).append(recordings)
+    with open(path, "ab") as partial:
+        partial.write(frame_header.pack(replay_magic, 0, 1000) + b"\0" * 100)
+    size = os.path.getsize(path)
+
+    assert [recording["gen"] for recording in read_replays(path)] == [0, 1, 2]
+    assert os.path.getsize(path) == size
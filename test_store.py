@@ -0,0 +1,63 @@
+'''Checks the run store: the experiment index only lists complete runs once, and runs saved as pickles by older
+    versions still load. Run with: python -m pytest -q'''
+import json
+import os
+import pickle
+import numpy as np
+import pytest
+from deap import base, creator, tools
+from enums import Experiment, ExperimentType
+from store import (experiment_folder, read_index, list_runs, load_run_stats, load_population, load_simulation_info,
+                   is_legacy_run)
+from test_equivalence import run
+
+# Random genomes overflow the activation functions, which is expected
+pytestmark = pytest.mark.filterwarnings("ignore::RuntimeWarning")
+
+final = {"exp": Experiment.FINAL_ALGORITHM, "exp_type": ExperimentType.FINAL_ALGORITHM}
+
+
+def test_index_lists_complete_runs_once(tmp_path, monkeypatch):
+    '''A run saved again is listed once with its latest metadata, and runs that are incomplete or whose index line
+        was cut short are left out'''
+    monkeypatch.chdir(tmp_path)
+    for seed in range(2):
+        run(gen_num=2, pop_num=10, seed=seed, **final)
+    run(gen_num=2, pop_num=10, seed=5, run_num=1, **final)
+    index_path = experiment_folder(**final) + "//" + "index" + ".jsonl"
+    with open(index_path, "a") as index_file:
+        index_file.write(json.dumps({"run": "run-3", "label": "incomplete"}) + "\n")
+        index_file.write('{"run": "run-4", "lab')
+    os.makedirs(experiment_folder(**final) + "//" + "run-3")
+
+    runs = read_index(**final)
+    assert [metadata["run"] for metadata in runs] == ["run-2", "run-1"]
+    assert runs[1]["seed"] == 5
+    assert [os.path.basename(folder) for folder in list_runs(experiment_folder(**final))] == ["run-1", "run-2"]
+
+
+def test_legacy_pickle_runs_load(tmp_path):
+    '''Runs saved as label, logbook & final population pickles load the same as runs in the current format'''
+    creator.create("FitnessMax", base.Fitness, weights=(1.0,))
+    creator.create("Individual", list, fitness=creator.FitnessMax)
+    logbook = tools.Logbook()
+    for gen in range(3):
+        logbook.record(gen=gen, mean=gen * 0.5, max=gen + 1.0, std=0.1)
+    population = [creator.Individual(genome) for genome in np.arange(12.0).reshape(4, 3).tolist()]
+    for fit, individual in enumerate(population):
+        individual.fitness.values = (float(fit),)
+
+    folder = tmp_path / "run-1"
+    folder.mkdir()
+    for name, value in (("label", "algorithm-b"), ("logbook", logbook), ("final_population", population)):
+        with open(folder / (name + ".pkl"), "wb") as pickle_file:
+            pickle.dump(value, pickle_file)
+
+    assert is_legacy_run(str(folder)) and list_runs(str(tmp_path)) == [str(tmp_path) + "//run-1"]
+    label, stats = load_run_stats(str(folder), ["gen", "max"])
+    assert label == "algorithm-b" and stats["max"].tolist() == [1.0, 2.0, 3.0]
+    genomes, fitness = load_population(str(folder))
+    assert genomes.tolist() == np.arange(12.0).reshape(4, 3).tolist() and fitness.tolist() == [0.0, 1.0, 2.0, 3.0]
+    (loaded_label, loaded_logbook, loaded_population), = load_simulation_info(str(tmp_path))
+    assert loaded_label == "algorithm-b" and loaded_logbook.select("mean") == [0.0, 0.5, 1.0]
+    assert [individual.fitness.values for individual in loaded_population] == [(0.0,), (1.0,), (2.0,), (3.0,)]
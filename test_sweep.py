@@ -0,0 +1,33 @@
+'''Checks that a sweep skips the runs it already saved and refuses to mix in runs saved with other parameters.
+    Run with: python -m pytest -q'''
+import os
+import pytest
+from enums import Experiment, ExperimentType
+from sweep import expand_grid, job_folder, run_sweep
+
+# Random genomes overflow the activation functions, which is expected
+pytestmark = pytest.mark.filterwarnings("ignore::RuntimeWarning")
+
+
+def jobs(gen_num=2, pop_num=10):
+    '''Returns the jobs of a small seeded final algorithm sweep'''
+    return expand_grid(Experiment.FINAL_ALGORITHM, ExperimentType.FINAL_ALGORITHM, gen_num, pop_num, 2, seed=1)
+
+
+def test_sweep_skips_saved_runs_and_resumes(tmp_path, monkeypatch):
+    '''Running a sweep again only runs the jobs whose run is not completely saved'''
+    monkeypatch.chdir(tmp_path)
+    assert sorted(run_sweep(jobs(), 16, 16, 1)) == sorted(job_folder(job) for job in jobs())
+    assert run_sweep(jobs(), 16, 16, 1) == []
+
+    os.remove(job_folder(jobs()[1]) + "//" + "run" + ".json")
+    assert run_sweep(jobs(), 16, 16, 1) == [job_folder(jobs()[1])]
+
+
+@pytest.mark.parametrize("changed", [{"gen_num": 3}, {"pop_num": 12}])
+def test_sweep_refuses_runs_saved_with_other_parameters(tmp_path, monkeypatch, changed):
+    '''A sweep of another size raises rather than skipping the runs of the earlier sweep saved in the same folders'''
+    monkeypatch.chdir(tmp_path)
+    run_sweep(jobs(), 16, 16, 1)
+    with pytest.raises(FileExistsError):
+        run_sweep(jobs(**changed), 16, 16, 1)
@@ -1,10 +1,14 @@
 import matplotlib.pyplot as plt
+import multiprocessing
 import os
 from enums import Experiment, ExperimentType
-from genetic import load_simulation_info
+from store import list_runs, load_run_stats, run_fingerprint
 import numpy as np
 import pickle
 
+# Statistics columns the graphs are drawn from
+plot_columns = ["gen", "mean", "max", "std"]
+
 
 def graph_plot(ax, generations, data, colour_map, graph_type, iteration_num, exp, exp_type, plot_std=False, stds=None):
     '''Plots a line graph of fitness against generation. This can be either mean or max depending on the data
@@ -72,10 +76,67 @@ def initialise_graphs():
     return ax1, ax2, ax3
 
 
-def plot_experiment(exp, exp_type, plot_std=False):
+def plot_stats(run_folder):
+    '''Returns the label of a run and the statistics columns used by the graphs'''
+    return load_run_stats(run_folder, plot_columns)
+
+
+def update_plot_cache(save_location, alteration_folders, workers=None):
+    '''Returns the label, generations, mean/max/std fitness averaged over the runs and the final generation mean
+        fitness of every run for each alteration folder that has runs, keyed by the folder. These are kept in a cache
+        file in the experiment folder along with the statistics of each run & a fingerprint of its files, so only
+        runs that are new or saved again since the last call are read (over worker processes when there are
+        several, using every core if workers is None) and only alterations whose runs changed are averaged again.'''
+    cache_path = save_location + "//" + "plot-cache" + ".pkl"
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as cache_file:
+            cache = pickle.load(cache_file)
+    cached_runs = {run: summary for entry in cache.values() for run, summary in entry["runs"].items()}
+
+    # Runs & alterations are keyed relative to the experiment folder so the cache does not depend on the cwd
+    runs = {os.path.relpath(folder, save_location): list_runs(folder) for folder in alteration_folders}
+    fingerprints = {os.path.relpath(run, save_location): run_fingerprint(run)
+                    for folder_runs in runs.values() for run in folder_runs}
+    stale = [run for run, fingerprint in fingerprints.items()
+             if run not in cached_runs or cached_runs[run][0] != fingerprint]
+    stale_set = set(stale)
+    stale_folders = [save_location + "//" + run for run in stale]
+    if len(stale) > 1 and workers != 1:
+        with multiprocessing.Pool(workers) as pool:
+            loaded = pool.map(plot_stats, stale_folders)
+    else:
+        loaded = [plot_stats(run) for run in stale_folders]
+    cached_runs.update((run, (fingerprints[run],) + stats) for run, stats in zip(stale, loaded))
+
+    summaries = {}
+    for folder, folder_runs in runs.items():
+        folder_runs = [os.path.relpath(run, save_location) for run in folder_runs]
+        if not folder_runs:
+            continue
+        if folder in cache and list(cache[folder]["runs"]) == folder_runs and stale_set.isdisjoint(folder_runs):
+            summaries[folder] = cache[folder]
+            continue
+        run_stats = [cached_runs[run][2] for run in folder_runs]
+        summaries[folder] = {"runs": {run: cached_runs[run] for run in folder_runs},
+                             "label": cached_runs[folder_runs[0]][1], "gen": run_stats[0]["gen"],
+                             **{column: np.mean([stats[column] for stats in run_stats], axis=0)
+                                for column in ("mean", "max", "std")},
+                             "final": [float(stats["mean"][-1]) for stats in run_stats]}
+
+    if stale or summaries.keys() != cache.keys():
+        with open(cache_path + ".tmp", "wb") as cache_file:
+            pickle.dump(summaries, cache_file)
+        os.replace(cache_path + ".tmp", cache_path)
+    return {save_location + "//" + folder if folder != "." else save_location: summary
+            for folder, summary in summaries.items()}
+
+
+def plot_experiment(exp, exp_type, plot_std=False, workers=None):
     '''Loads the saved data for a given experiment and experiment type and plots a line graph of the mean and maximum
     fitness over the generations, and a box plot of the distribution of average fitness from the final generation
-    of each iteration '''
+    of each iteration. The graphs are drawn from the cache kept by update_plot_cache, so only runs saved since the
+    last call are read, over workers processes.'''
     if exp_type == ExperimentType.EXPLORATION:
         iteration_num = 5
     elif exp_type == ExperimentType.FINAL:
@@ -94,36 +155,22 @@ def plot_experiment(exp, exp_type, plot_std=False):
     final_generation_averages = []
 
     if exp != Experiment.FINAL_ALGORITHM:
-        alterations = [folder for folder in os.listdir(
+        alterations = [save_location + "//" + folder for folder in os.listdir(
             save_location) if os.path.isdir(save_location + "//" + folder)]
     else:
-        # Slight hack to only ensure the folder is checked + plotted once
-        alterations = range(1)
+        alterations = [save_location]
 
+    # Only the per-alteration aggregates are used, the runs themselves are only read when new or saved again
+    summaries = update_plot_cache(save_location, alterations, workers)
     for alteration in alterations:
-        if exp != Experiment.FINAL_ALGORITHM:
-            iterations = load_simulation_info(
-                save_location + "//" + alteration)
-        else:
-            iterations = load_simulation_info(save_location)
-
-        logbooks = [run[1] for run in iterations]
-
-        means, maxes, stds = ([] for _ in range(3))
-        final_averages = []
-
-        for logbook in logbooks:
-            means.append(logbook.select("mean"))
-            maxes.append(logbook.select("max"))
-            stds.append(logbook.select("std"))
-            final_averages.append(logbook.select("mean")[-1])
-
-        # Averages the stats over the iterations
-        label = iterations[0][0]
-        averaged_means.append((label, np.mean(means, axis=0)))
-        averaged_maxes.append((label, np.mean(maxes, axis=0)))
-        averaged_stds.append((label, np.mean(stds, axis=0)))
-        final_generation_averages.append((label, final_averages))
+        if alteration not in summaries:
+            continue    # no complete runs yet
+        summary = summaries[alteration]
+        averaged_means.append((summary["label"], summary["mean"]))
+        averaged_maxes.append((summary["label"], summary["max"]))
+        averaged_stds.append((summary["label"], summary["std"]))
+        final_generation_averages.append((summary["label"], summary["final"]))
+        generations = summary["gen"]
 
     if exp != Experiment.FINAL_ALGORITHM:
         final_generation_file = open(
@@ -132,11 +179,11 @@ def plot_experiment(exp, exp_type, plot_std=False):
         final_generation_file.close()
 
     ax1.title.set_text("Mean fitness over all generations")
-    graph_plot(ax1, logbooks[0].select("gen"), averaged_means, plt.get_cmap(
+    graph_plot(ax1, generations, averaged_means, plt.get_cmap(
         "gist_rainbow"), "mean", iteration_num, exp, exp_type, plot_std, averaged_stds)
 
     ax2.title.set_text("Max fitness over all generations")
-    graph_plot(ax2, logbooks[0].select("gen"), averaged_maxes, plt.get_cmap(
+    graph_plot(ax2, generations, averaged_maxes, plt.get_cmap(
         "gist_rainbow"), "max", iteration_num, exp, exp_type)
 
     ax3.title.set_text(